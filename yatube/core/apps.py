@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+
+        from .db import check_connections, configure_connection
+
+        connection_created.connect(configure_connection)
+        request_started.connect(check_connections)
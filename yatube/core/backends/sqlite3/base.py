@@ -0,0 +1,19 @@
+"""SQLite, в котором транзакции сразу берут блокировку записи.
+
+Стандартный бэкенд открывает транзакцию отложенным BEGIN: она читает
+снимок и пытается стать пишущей только на первой записи. В режиме WAL
+это невозможно, если с начала снимка кто-то уже закоммитил: SQLite
+сразу отвечает «database is locked», busy_timeout тут не помогает.
+BEGIN IMMEDIATE ждёт блокировку записи заранее, в пределах busy_timeout,
+и такой транзакции ошибка уже не грозит.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Снимок только для чтения (core.db.read_snapshot) открывается
+    # обычным BEGIN: в WAL он не мешает писателям.
+    immediate = True
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.immediate else 'BEGIN')
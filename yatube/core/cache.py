@@ -0,0 +1,271 @@
+"""Кэш в файле SQLite, общий для всех процессов сервера.
+
+LocMemCache у каждого воркера свой: кэш страниц прогревается заново в
+каждом процессе, а память умножается на число воркеров. Этот бэкенд
+держит записи в одном файле базы в режиме WAL: читатели не ждут
+писателя, а чтение идёт через mmap. Объём ограничен по байтам
+(MAX_SIZE) и по числу записей (MAX_ENTRIES), вытесняются давно не
+читанные записи. Время последнего чтения обновляется не чаще раза в
+ACCESS_RESOLUTION секунд, чтобы горячие ключи не превращали каждое
+чтение в запись.
+
+Целые числа лежат как INTEGER, поэтому incr — один UPDATE, атомарный
+и между процессами. Остальное хранится в pickle.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value, expires REAL,'
+    ' accessed REAL NOT NULL, size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_stats ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+    ' size INTEGER NOT NULL, entries INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0)',
+    # Суммарный объём ведут триггеры: проверка лимита — одна строка.
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE cache_stats SET size = size + NEW.size,'
+    ' entries = entries + 1; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE cache_stats SET size = size - OLD.size,'
+    ' entries = entries - 1; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size'
+    ' ON cache BEGIN'
+    ' UPDATE cache_stats SET size = size - OLD.size + NEW.size; END',
+)
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed, size)'
+    ' VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET'
+    ' value = excluded.value, expires = excluded.expires,'
+    ' accessed = excluded.accessed, size = excluded.size'
+)
+# Ограничение SQLite на число параметров запроса.
+MAX_PARAMS = 500
+
+
+def encode(value):
+    # bool — тоже int, но после incr он перестал бы быть bool.
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value, 8
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return data, len(data)
+
+
+def decode(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_size = int(options.get('MAX_SIZE', 256 * 1024 * 1024))
+        self.access_resolution = float(options.get('ACCESS_RESOLUTION', 1))
+        self.mmap_size = int(options.get('MMAP_SIZE', self.max_size))
+        self.busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Своё соединение на поток и на процесс: после fork соединение
+        # родителя использовать нельзя.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.location, isolation_level=None)
+            connection.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    @contextmanager
+    def write(self):
+        """Транзакция записи: BEGIN IMMEDIATE сразу берёт блокировку,
+        поэтому чтение и запись внутри неё не разрываются чужой."""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        now = time.time()
+        found, stale = {}, []
+        for start in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[start:start + MAX_PARAMS]
+            rows = self.connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = value
+                if accessed < now - self.access_resolution:
+                    stale.append(key)
+        if stale:
+            self._touch_accessed(stale, now)
+        return found
+
+    def _touch_accessed(self, keys, now):
+        # Отметка для LRU — подсказка, ждать ради неё не стоит: пока
+        # блокировку держит писатель, busy_timeout нулевой.
+        connection = self.connection
+        connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, key) for key in keys],
+            )
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            connection.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._fetch([key])
+        return decode(found[key]) if key in found else default
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        return {
+            names[key]: decode(value)
+            for key, value in self._fetch(list(names)).items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self._key(key, version), *self._encoded(value, expires, now))
+            for key, value in data.items()
+        ]
+        with self.write() as connection:
+            connection.executemany(UPSERT, rows)
+            self._cull(connection, now)
+        return []
+
+    def _encoded(self, value, expires, now):
+        value, size = encode(value)
+        return value, expires, now, size
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = (key, *self._encoded(value, self.get_backend_timeout(timeout),
+                                   now))
+        with self.write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now)
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed,'
+                ' size) VALUES (?, ?, ?, ?, ?)', row
+            ).rowcount == 1
+            if added:
+                self._cull(connection, now)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self.write() as connection:
+            # RETURNING есть в SQLite начиная с 3.35.
+            row = connection.execute(
+                'UPDATE cache SET value = value + ? WHERE key = ?'
+                " AND typeof(value) = 'integer'"
+                ' AND (expires IS NULL OR expires > ?)'
+                ' RETURNING value',
+                (delta, key, time.time()),
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self.write() as connection:
+            return connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time()),
+            ).rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        with self.write() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                [(self._key(key, version),) for key in keys],
+            )
+
+    def has_key(self, key, version=None):
+        return bool(self._fetch([self._key(key, version)]))
+
+    def clear(self):
+        with self.write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def _cull(self, connection, now):
+        size, entries = connection.execute(
+            'SELECT size, entries FROM cache_stats'
+        ).fetchone()
+        if size <= self.max_size and entries <= self._max_entries:
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        size, entries = connection.execute(
+            'SELECT size, entries FROM cache_stats'
+        ).fetchone()
+        # Как и у встроенных бэкендов, вытесняем с запасом — долю
+        # 1/CULL_FREQUENCY, чтобы не чистить на каждой записи.
+        target_size = self.max_size - self.max_size // self._cull_frequency
+        target_entries = (
+            self._max_entries - self._max_entries // self._cull_frequency
+        )
+        while size > target_size or entries > target_entries:
+            batch = max(1, entries // self._cull_frequency // 4)
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache'
+                ' ORDER BY accessed LIMIT ?)', (batch,)
+            )
+            size, entries = connection.execute(
+                'SELECT size, entries FROM cache_stats'
+            ).fetchone()
+
+    def close(self, **kwargs):
+        # Соединение живёт всё время процесса: открывать файл на каждый
+        # запрос дороже, чем держать его.
+        pass
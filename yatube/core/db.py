@@ -0,0 +1,120 @@
+"""Настройки базы данных из окружения.
+
+По умолчанию это файл SQLite рядом с проектом. DB_ENGINE=postgresql
+переключает на PostgreSQL (нужен psycopg2), параметры подключения
+берутся из DB_NAME, DB_USER, DB_PASSWORD, DB_HOST и DB_PORT.
+
+SQLite при каждом новом соединении получает PRAGMA из SQLITE_PRAGMAS:
+WAL, чтобы читатели не ждали писателя, synchronous=NORMAL, mmap и кэш
+страниц, а busy_timeout заставляет писателей ждать блокировку, а не
+сразу падать с «database is locked». Транзакции на SQLite открываются
+через BEGIN IMMEDIATE (core.backends.sqlite3), поэтому ATOMIC_REQUESTS
+там выключен: иначе каждый запрос, даже чтение, ждал бы писателей.
+Пишущие представления открывают транзакцию сами. Долгим чтениям,
+которым нужен один снимок базы, служит read_snapshot.
+
+Соединения живут DB_CONN_MAX_AGE секунд и переходят между запросами.
+Django 2.2 не проверяет, живо ли такое соединение, поэтому в начале
+запроса это делает check_connections: упавшее соединение закрывается
+и открывается заново при первом обращении.
+"""
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SQLITE = 'core.backends.sqlite3'
+POSTGRESQL = 'django.db.backends.postgresql'
+ENGINES = {'sqlite': SQLITE, 'postgresql': POSTGRESQL}
+
+
+def database_settings(base_dir, environ=os.environ):
+    """Словарь для DATABASES['default'] по переменным окружения."""
+    engine = environ.get('DB_ENGINE', 'sqlite')
+    if engine not in ENGINES:
+        raise ValueError(
+            f'DB_ENGINE должен быть одним из {", ".join(ENGINES)}'
+        )
+    database = {
+        'ENGINE': ENGINES[engine],
+        # Счётчики обновляются сигналами в одной транзакции с записью.
+        # На SQLite её открывают сами пишущие представления, см. выше.
+        'ATOMIC_REQUESTS': engine != 'sqlite',
+        'CONN_MAX_AGE': int(environ.get('DB_CONN_MAX_AGE', 60)),
+        # Так же называется настройка, появившаяся в Django 4.1.
+        'CONN_HEALTH_CHECKS': environ.get('DB_HEALTH_CHECKS', '1') == '1',
+    }
+    if engine == 'sqlite':
+        database['NAME'] = environ.get(
+            'DB_NAME', os.path.join(base_dir, 'db.sqlite3')
+        )
+        return database
+    database.update({
+        'NAME': environ.get('DB_NAME', 'yatube'),
+        'USER': environ.get('DB_USER', 'yatube'),
+        'PASSWORD': environ.get('DB_PASSWORD', ''),
+        'HOST': environ.get('DB_HOST', 'localhost'),
+        'PORT': environ.get('DB_PORT', '5432'),
+        'OPTIONS': {
+            'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+    })
+    return database
+
+
+def sqlite_pragmas(environ=os.environ):
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(environ.get('DB_BUSY_TIMEOUT', 5000)),
+        'mmap_size': int(environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Отрицательное значение — размер в КиБ, а не в страницах.
+        'cache_size': int(environ.get('DB_CACHE_SIZE', -64 * 1024)),
+    }
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Обработчик connection_created: PRAGMA для SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_connections(**kwargs):
+    """Обработчик request_started: закрывает постоянные соединения,
+    которые перестали отвечать."""
+    for connection in connections.all():
+        if (connection.connection is None
+                or not connection.settings_dict.get('CONN_MAX_AGE')
+                or not connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                or connection.in_atomic_block):
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+@contextmanager
+def read_snapshot(using=DEFAULT_DB_ALIAS):
+    """Транзакция для чтения: все запросы внутри видят один снимок базы.
+
+    На SQLite это отложенный BEGIN, который не берёт блокировку записи,
+    на PostgreSQL — REPEATABLE READ READ ONLY. Внутри уже открытой
+    транзакции её уровень изоляции не меняется.
+    """
+    connection = connections[using]
+    outermost = not connection.in_atomic_block
+    # Флаг читается только при BEGIN; вложенные atomic внутри снимка —
+    # точки сохранения.
+    connection.immediate = False
+    try:
+        with transaction.atomic(using=using):
+            if outermost and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL'
+                                   ' REPEATABLE READ READ ONLY')
+            yield
+    finally:
+        del connection.immediate
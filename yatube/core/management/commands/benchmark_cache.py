@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from core.metrics import percentile
+
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+
+
+def make_cache(name, directory, options):
+    location = {
+        'locmem': name,
+        'filebased': os.path.join(directory, 'files'),
+        'sqlite': os.path.join(directory, 'cache.sqlite3'),
+    }[name]
+    return import_string(BACKENDS[name])(location, {
+        'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2},
+    })
+
+
+def timed(operation, count):
+    latencies = []
+    for index in range(count):
+        started = time.perf_counter()
+        operation(index)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def worker(name, directory, options, number, barrier, results):
+    """Один «воркер сервера»: пишет свою долю ключей, затем читает все.
+
+    У locmem чужие ключи не видны, и доля попаданий падает как 1/N.
+    """
+    cache = make_cache(name, directory, options)
+    keys = options['keys']
+    processes = options['processes']
+    value = os.urandom(options['value_size'])
+    own = range(number, keys, processes)
+    writes = timed(lambda i: cache.set(f'key:{own[i]}', value), len(own))
+    barrier.wait()
+    hits = 0
+
+    def read(index):
+        nonlocal hits
+        hits += cache.get(f'key:{index % keys}') is not None
+
+    reads = timed(read, options['reads'])
+    batch = [f'key:{index}' for index in range(min(keys, 50))]
+    many = timed(lambda i: cache.get_many(batch), options['reads'] // 50)
+    cache.add('counter', 0)
+    barrier.wait()
+    incrs = timed(lambda i: cache.incr('counter'), options['reads'] // 10)
+    barrier.wait()
+    results.put({
+        'writes': writes, 'reads': reads, 'many': many, 'incrs': incrs,
+        'hits': hits, 'counter': cache.get('counter'),
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша locmem, filebased и sqlite под нагрузкой '
+        'из нескольких процессов: задержки операций и доля попаданий'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS,
+                            default=list(BACKENDS))
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--reads', type=int, default=5000,
+                            help='чтений на процесс')
+        parser.add_argument('--value-size', type=int, default=4096)
+        parser.add_argument('--output', help='куда сохранить JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in options['backends']:
+            directory = tempfile.mkdtemp()
+            try:
+                results[name] = self.run(name, directory, options)
+            finally:
+                shutil.rmtree(directory)
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def run(self, name, directory, options):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(options['processes'])
+        queue = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(
+                name, directory, options, number, barrier, queue
+            ))
+            for number in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        parts = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        result = {}
+        for operation in ('writes', 'reads', 'many', 'incrs'):
+            latencies = [value for part in parts for value in part[operation]]
+            result[f'{operation}_p50_ms'] = round(
+                percentile(latencies, 50), 4
+            )
+            result[f'{operation}_p99_ms'] = round(
+                percentile(latencies, 99), 4
+            )
+        reads = options['reads'] * options['processes']
+        result['hit_ratio'] = round(
+            sum(part['hits'] for part in parts) / reads, 3
+        )
+        # Для общего кэша итог равен числу всех incr: ни один не потерян.
+        result['counter'] = max(part['counter'] or 0 for part in parts)
+        return result
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"бэкенд":<11}{"set p50":>9}{"get p50":>9}{"get p99":>9}'
+            f'{"many p50":>10}{"incr p50":>10}{"попадания":>11}'
+            f'{"счётчик":>9}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<11}{result["writes_p50_ms"]:>9.3f}'
+                f'{result["reads_p50_ms"]:>9.3f}'
+                f'{result["reads_p99_ms"]:>9.3f}'
+                f'{result["many_p50_ms"]:>10.3f}'
+                f'{result["incrs_p50_ms"]:>10.3f}'
+                f'{result["hit_ratio"]:>11.3f}{result["counter"]:>9}'
+            )
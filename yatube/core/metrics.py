@@ -0,0 +1,59 @@
+"""Лёгкие метрики процесса: счётчики, значения и наблюдения.
+
+Хранятся в памяти текущего процесса и отдаются представлением
+core.views.metrics для сотрудников.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_observations = {}
+
+
+def percentile(values, percent):
+    """Значение, ниже которого лежат percent процентов values."""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[index]
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    """Копит число наблюдений, сумму и максимум."""
+    with _lock:
+        count, total, maximum = _observations.get(name, (0, 0, value))
+        _observations[name] = (count + 1, total + value, max(maximum, value))
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'observations': {
+                name: {
+                    'count': count,
+                    'total': total,
+                    'avg': total / count,
+                    'max': maximum,
+                }
+                for name, (count, total, maximum) in _observations.items()
+            },
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _observations.clear()
@@ -0,0 +1,90 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'IN \((%s, )*%s\)')
+SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL без параметров: одинаковые запросы с разными значениями."""
+    return SPACES.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class QueryRecorder:
+    """Обёртка для connection.execute_wrapper: число и время запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class QueryBudgetMiddleware:
+    """Сверяет запросы к БД за время запроса с бюджетом из настроек.
+
+    Бюджеты задаются в QUERY_BUDGETS по имени маршрута
+    (`posts:index`, ...), превышение пишется в лог вместе с самыми
+    частыми запросами. При QUERY_BUDGET_SERVER_TIMING ответ получает
+    заголовок Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        duration_ms = recorder.duration * 1000
+        self.check_budget(request, view_name, recorder, duration_ms)
+        if settings.QUERY_BUDGET_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={duration_ms:.1f};desc="{recorder.count} queries"'
+            )
+        return response
+
+    def check_budget(self, request, view_name, recorder, duration_ms):
+        if view_name is None:
+            return
+        metrics.observe(f'db.queries.{view_name}', recorder.count)
+        metrics.observe(f'db.ms.{view_name}', duration_ms)
+        budget = settings.QUERY_BUDGETS.get(
+            view_name, settings.QUERY_BUDGET_DEFAULT
+        )
+        if (recorder.count <= budget['queries']
+                and duration_ms <= budget['ms']):
+            return
+        metrics.incr(f'db.budget_exceeded.{view_name}')
+        top = '\n'.join(
+            f'  {count} x {sql[:200]}'
+            for sql, count in recorder.fingerprints.most_common(5)
+        )
+        logger.warning(
+            'Превышен бюджет запросов %s %s: %d запросов (бюджет %d), '
+            '%.1f мс (бюджет %d)\n%s',
+            view_name, request.path, recorder.count, budget['queries'],
+            duration_ms, budget['ms'], top,
+        )
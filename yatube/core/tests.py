@@ -0,0 +1,326 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.utils import ConnectionHandler
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import db
+from core.cache import SQLiteCache
+from posts.models import Post
+
+User = get_user_model()
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+        cls.post = Post.objects.create(author=cls.user, text='пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    @override_settings(QUERY_BUDGETS={
+        'posts:post_detail': {'queries': 0, 'ms': 1000}
+    })
+    def test_breach_is_logged_with_fingerprints(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+            )
+        self.assertIn('posts:post_detail', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(QUERY_BUDGET_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('about:author'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.location = os.path.join(directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        # Отдельный экземпляр с тем же файлом — как другой воркер.
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set('page', {'html': 'страница'})
+        self.cache.set_many({'a': 1, 'b': True, 'c': 2 ** 70})
+        other = self.make_cache()
+        self.assertEqual(other.get('page'), {'html': 'страница'})
+        self.assertEqual(
+            other.get_many(['a', 'b', 'c', 'missing']),
+            {'a': 1, 'b': True, 'c': 2 ** 70},
+        )
+        self.assertIs(other.get('b'), True)
+        other.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_read_does_not_wait_for_writer(self):
+        reader = self.make_cache(ACCESS_RESOLUTION=0, BUSY_TIMEOUT=3000)
+        reader.set('key', 'value')
+        started = time.monotonic()
+        with self.make_cache().write():
+            # Отметка LRU не ждёт блокировку писателя.
+            self.assertEqual(reader.get('key'), 'value')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(
+            reader.connection.execute('PRAGMA busy_timeout').fetchone(),
+            (3000,),
+        )
+
+    def test_add_touch_and_expiry(self):
+        self.assertTrue(self.cache.add('key', 'first', 0.05))
+        self.assertFalse(self.cache.add('key', 'second'))
+        time.sleep(0.06)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(self.cache.touch('key'))
+        self.assertTrue(self.cache.add('key', 'third'))
+        self.assertTrue(self.cache.touch('key', None))
+        self.assertEqual(self.cache.get('key'), 'third')
+
+    def test_incr_is_atomic(self):
+        self.cache.set('counter', 0)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+        def bump():
+            worker = self.make_cache()
+            for _ in range(50):
+                worker.incr('counter')
+
+        threads = [threading.Thread(target=bump) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+
+    def test_least_recently_read_are_evicted_first(self):
+        cache = self.make_cache(
+            MAX_SIZE=20 * 1024, CULL_FREQUENCY=4, ACCESS_RESOLUTION=0
+        )
+        value = b'x' * 1000
+        cache.set('hot', value)
+        for index in range(60):
+            cache.set(f'cold:{index}', value)
+            cache.get('hot')
+        self.assertEqual(cache.get('hot'), value)
+        self.assertIsNone(cache.get('cold:0'))
+        stored = cache.connection.execute(
+            'SELECT SUM(size), COUNT(*) FROM cache'
+        ).fetchone()
+        self.assertLessEqual(stored[0], 20 * 1024)
+        self.assertEqual(stored, cache.connection.execute(
+            'SELECT size, entries FROM cache_stats'
+        ).fetchone())
+
+    def test_entry_limit(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        for index in range(25):
+            cache.set(index, index)
+        self.assertLessEqual(
+            cache.connection.execute('SELECT COUNT(*) FROM cache').fetchone(),
+            (10,),
+        )
+
+    def test_benchmark_command(self):
+        output = StringIO()
+        call_command('benchmark_cache', processes=2, keys=20, reads=100,
+                     value_size=64, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        sqlite = lines[-1].split()
+        self.assertEqual(sqlite[0], 'sqlite')
+        # Все процессы видят ключи друг друга и ни один incr не потерян.
+        self.assertEqual(sqlite[-2:], ['1.000', '20'])
+
+
+class DatabaseSettingsTest(SimpleTestCase):
+    def test_sqlite_by_default(self):
+        database = db.database_settings('/srv', {})
+        self.assertEqual(database['ENGINE'], db.SQLITE)
+        self.assertEqual(database['NAME'], os.path.join('/srv', 'db.sqlite3'))
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertFalse(database['ATOMIC_REQUESTS'])
+
+    def test_postgresql_from_environment(self):
+        database = db.database_settings('/srv', {
+            'DB_ENGINE': 'postgresql', 'DB_NAME': 'posts',
+            'DB_HOST': 'db', 'DB_CONN_MAX_AGE': '0',
+        })
+        self.assertEqual(database['ENGINE'], db.POSTGRESQL)
+        self.assertEqual(
+            (database['NAME'], database['HOST'], database['PORT']),
+            ('posts', 'db', '5432'),
+        )
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertTrue(database['ATOMIC_REQUESTS'])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            db.database_settings('/srv', {'DB_ENGINE': 'oracle'})
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'PRAGMA SQLite')
+class SQLitePragmaTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        pragmas = db.sqlite_pragmas({})
+        self.assertEqual(self.pragma('synchronous'), 1)
+        for name in ('busy_timeout', 'cache_size'):
+            with self.subTest(name=name):
+                self.assertEqual(self.pragma(name), pragmas[name])
+
+
+class ConnectionHealthCheckTest(SimpleTestCase):
+    def setUp(self):
+        # Соединение с базой в памяти Django не закрывает, нужен файл.
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.handler = ConnectionHandler({'default': db.database_settings(
+            settings.BASE_DIR, {'DB_NAME': os.path.join(directory, 'db')}
+        )})
+        self.database = self.handler['default']
+        self.addCleanup(self.database.close)
+
+    def test_broken_persistent_connection_is_closed(self):
+        self.database.ensure_connection()
+        with mock.patch('core.db.connections', self.handler):
+            db.check_connections()
+            self.assertIsNotNone(self.database.connection)
+            with mock.patch.object(self.database, 'is_usable',
+                                   return_value=False):
+                db.check_connections()
+        self.assertIsNone(self.database.connection)
+
+    def test_file_database_is_in_wal_mode(self):
+        with self.database.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone(), ('wal',))
+
+
+class SQLiteWriteTransactionTest(SimpleTestCase):
+    """Транзакция читает, другое соединение в это время коммитит запись,
+    затем транзакция пишет сама — как представление в запросе."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'db')
+        with sqlite3.connect(self.path) as other:
+            other.execute('PRAGMA journal_mode = WAL')
+            other.execute('CREATE TABLE note (text TEXT)')
+
+    def read_then_write(self, engine):
+        handler = ConnectionHandler({'default': dict(
+            db.database_settings(settings.BASE_DIR, {'DB_NAME': self.path}),
+            ENGINE=engine,
+        )})
+        database = handler['default']
+        self.addCleanup(database.close)
+        other = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None,
+            check_same_thread=False,
+        )
+        self.addCleanup(other.close)
+        writer = threading.Thread(
+            target=other.execute, args=("INSERT INTO note VALUES ('b')",)
+        )
+        with mock.patch('django.db.transaction.connections', handler):
+            try:
+                with transaction.atomic(), database.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM note')
+                    writer.start()
+                    writer.join(0.2)
+                    cursor.execute("INSERT INTO note VALUES ('a')")
+            finally:
+                writer.join()
+        return other.execute('SELECT COUNT(*) FROM note').fetchone()[0]
+
+    def test_deferred_begin_fails_at_once(self):
+        started = time.monotonic()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self.read_then_write('django.db.backends.sqlite3')
+        # busy_timeout не помогает: ошибка приходит сразу.
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_immediate_begin_waits_for_lock(self):
+        self.assertEqual(self.read_then_write(db.SQLITE), 2)
+
+
+class ReadSnapshotTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'db')
+        self.handler = ConnectionHandler({'default': db.database_settings(
+            settings.BASE_DIR, {'DB_NAME': path}
+        )})
+        self.database = self.handler['default']
+        self.addCleanup(self.database.close)
+        with self.database.cursor() as cursor:
+            cursor.execute('CREATE TABLE note (text TEXT)')
+        # Писатель не ждёт: снимок не должен держать блокировку записи.
+        self.other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        self.addCleanup(self.other.close)
+
+    def count(self):
+        with self.database.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM note')
+            return cursor.fetchone()[0]
+
+    def test_commits_of_others_are_not_seen(self):
+        with mock.patch('core.db.connections', self.handler), \
+                mock.patch('django.db.transaction.connections', self.handler):
+            with db.read_snapshot():
+                self.assertEqual(self.count(), 0)
+                self.other.execute("INSERT INTO note VALUES ('a')")
+                self.assertEqual(self.count(), 0)
+            self.assertEqual(self.count(), 1)
+            # Обычные транзакции снова берут блокировку записи сразу.
+            self.assertTrue(self.database.immediate)
+
+
+@unittest.skipUnless(
+    os.environ.get('YATUBE_TEST_POSTGRES'),
+    'нужен локальный PostgreSQL: YATUBE_TEST_POSTGRES=1 и DB_*'
+)
+class PostgreSQLConnectionTest(SimpleTestCase):
+    def test_connects_and_checks_health(self):
+        handler = ConnectionHandler({'default': db.database_settings(
+            settings.BASE_DIR, dict(os.environ, DB_ENGINE='postgresql')
+        )})
+        database = handler['default']
+        try:
+            with database.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                self.assertEqual(cursor.fetchone(), (1,))
+            self.assertTrue(database.is_usable())
+        finally:
+            database.close()
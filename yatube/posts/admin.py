@@ -1,22 +1,55 @@
 from django.contrib import admin
+
+from . import search
+from .changelist import ScalableAdmin
 from .models import Post, Group, Comment
 
 # Register your models here.
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     # Перечисляем поля, которые должны отображаться в админке
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
-    list_editable = ('group',)
+    # Автор и группа приходят тем же запросом, что и посты. Группу
+    # меняем в форме поста: выпадающий список в каждой строке списка
+    # стоил бы запроса на строку.
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
+    autocomplete_fields = ('group',)
+    keyset_keys = ('pub_date', 'id')
     # Добавляем интерфейс для поиска по тексту постов
     search_fields = ('text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # На SQLite ищем по полнотекстовому индексу, а не LIKE '%…%'.
+        expression = search.match_expression(search_term)
+        if expression is None or not search.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        where, params = search.match_condition(expression)
+        return queryset.extra(where=[where], params=params), False
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    # Нужен автодополнению группы в форме поста.
+    search_fields = ('title', 'slug')
+
+
+class CommentAdmin(ScalableAdmin):
+    list_display = ('pk', 'text', 'author', 'post', 'created')
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('author', 'post')
+    keyset_keys = ('created', 'id')
+    empty_value_display = '-пусто-'
+
 
 # При регистрации модели Post источником конфигурации для неё назначаем
 # класс PostAdmin
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Comment)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,209 @@
+"""Кэш страниц лент с версиями вместо короткого TTL.
+
+Для каждой области (вся лента, группа, автор) в кэше лежит счётчик
+поколения. Запись поста или комментария увеличивает счётчики затронутых
+областей, а ключ закэшированной страницы включает их текущие значения:
+после записи страница сразу собирается заново, а пока ничего не
+меняется, живёт FEED_CACHE_TIMEOUT. Копия лежит под ключом без
+поколений, поэтому после записи её ещё можно отдать, пока новая
+собирается.
+
+Те же поколения служат валидатором для условных GET: ETag страницы —
+хэш её ключа в кэше, и клиент с актуальной копией получает 304, не
+дожидаясь ни шаблонов, ни даже чтения кэша страниц.
+"""
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from core import metrics
+
+# Множитель раннего обновления: 1 — по Ваттани и др., больше — раньше.
+EARLY_REFRESH_BETA = 1.0
+LOCK_POLL_INTERVAL = 0.05
+
+SITE = 'site'
+GROUP = 'group'
+AUTHOR = 'author'
+
+
+def generation_key(scope, name=None):
+    return f'gen:{scope}' if name is None else f'gen:{scope}:{name}'
+
+
+def _initial():
+    # Не 1: после вытеснения счётчика из кэша нельзя снова выдать номер,
+    # под которым уже лежат устаревшие страницы.
+    return time.time_ns()
+
+
+def generations(scopes):
+    """Текущие поколения областей; недостающие заводятся заново."""
+    keys = [generation_key(*scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump(scope, name=None):
+    # Второй раз после коммита: параллельный GET мог прочитать строки
+    # до нашей записи и сохранить страницу под новым поколением.
+    key = generation_key(scope, name)
+    _advance(key)
+    transaction.on_commit(lambda: _advance(key))
+
+
+def _advance(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial(), None)
+
+
+def cache_by_generation(scopes, timeout=None):
+    """Кэширует GET-ответ вью до смены поколения любой из областей.
+
+    scopes(request, *args, **kwargs) возвращает список пар
+    (область, имя). Ключ зависит ещё от пути с параметрами и
+    пользователя: шапка и кнопки подписки у всех разные.
+
+    Страница пересобирается одним запросом (single-flight): кто взял
+    блокировку, тот рендерит, остальные получают прежнюю копию, а если
+    её нет — ждут готовую. Незадолго до истечения копия с некоторой
+    вероятностью пересобирается заранее, тем раньше, чем дольше рендер.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions = generations(scopes(request, *args, **kwargs))
+            etag = key_etag(page_key(request, view.__name__, versions))
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                revalidate(response, etag)
+                return response
+            slot = page_key(request, view.__name__, [])
+            entry = cache.get(slot)
+            fresh = entry is not None and entry['versions'] == versions
+            if fresh and not should_refresh(entry):
+                metrics.incr('page_cache.hit')
+                return entry['response']
+            lock = f'lock:{slot}'
+            if cache.add(lock, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+                metrics.incr(
+                    'page_cache.early_refresh' if fresh else 'page_cache.miss'
+                )
+                try:
+                    return render(view, request, args, kwargs, slot,
+                                  versions, etag, timeout)
+                finally:
+                    cache.delete(lock)
+            if entry is not None:
+                metrics.incr('page_cache.stale')
+                return entry['response']
+            entry = wait_for(slot, versions)
+            if entry is not None:
+                return entry['response']
+            # Сборщик не успел: рендерим сами, не дожидаясь его.
+            return render(view, request, args, kwargs, slot, versions, etag,
+                          timeout)
+        return wrapper
+    return decorator
+
+
+def render(view, request, args, kwargs, slot, versions, etag, timeout):
+    started = time.monotonic()
+    response = view(request, *args, **kwargs)
+    if is_cacheable(response):
+        revalidate(response, etag)
+        if timeout is None:
+            timeout = settings.FEED_CACHE_TIMEOUT
+        cache.set(slot, {
+            'versions': versions,
+            'response': response,
+            'delta': time.monotonic() - started,
+            'expires': time.time() + timeout,
+        }, timeout + settings.FEED_CACHE_STALE)
+    return response
+
+
+def should_refresh(entry):
+    """Вероятностное раннее обновление (XFetch): чем ближе истечение и
+    дольше рендер, тем вероятнее пересобрать копию заранее."""
+    if time.time() >= entry['expires']:
+        return True
+    jitter = -math.log(1 - random.random())
+    return time.time() + entry['delta'] * EARLY_REFRESH_BETA * jitter >= (
+        entry['expires']
+    )
+
+
+def wait_for(slot, versions):
+    """Ждёт копию текущих поколений, которую собирает другой запрос."""
+    metrics.incr('page_cache.lock_wait')
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(slot)
+        if entry is not None and entry['versions'] == versions:
+            return entry
+    metrics.incr('page_cache.lock_timeout')
+    return None
+
+
+def conditional(etag_func):
+    """condition() для страниц, не лежащих в кэше целиком: 304 по
+    дешёвому ETag, иначе обычный рендер. Last-Modified не отдаём:
+    ETag зависит и от поколений, и от пользователя, а дата — нет."""
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def key_etag(key):
+    return quote_etag(key.rsplit(':', 1)[-1])
+
+
+def revalidate(response, etag):
+    # no-cache: копию можно хранить, но перед показом сверять ETag —
+    # иначе браузер показал бы ленту без свежих постов.
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+
+
+def page_key(request, name, versions):
+    raw = '|'.join([
+        request.get_full_path(),
+        str(request.user.pk or ''),
+        *map(str, versions),
+    ])
+    return f'page:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def is_cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+    )
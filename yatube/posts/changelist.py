@@ -0,0 +1,164 @@
+"""Списки админки, которые не тормозят на миллионах строк.
+
+Обычный список объектов в админке на каждой странице делает COUNT(*)
+по всей таблице, листает через OFFSET и удаляет выбранное одной
+транзакцией. Здесь число строк оценивается по статистике базы,
+страницы по умолчанию листаются курсором по ключу сортировки, а
+действия над выбранными объектами идут пачками, каждая в своей
+транзакции.
+"""
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
+
+from .paginators import CursorPaginator
+
+CURSOR_VAR = 'cursor'
+
+
+def table_estimate(model, using):
+    """Оценка числа строк таблицы по статистике базы или None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 заполняет ANALYZE (и PRAGMA optimize).
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table]
+            )
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [table],
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+    return None
+
+
+def estimated_count(queryset, cap):
+    """Число строк: по статистике, если фильтров нет, иначе точное, но
+    не больше cap + 1, чтобы подсчёт не шёл по всей таблице."""
+    if not queryset.query.where:
+        estimate = table_estimate(queryset.model, queryset.db)
+        if estimate is not None:
+            return estimate
+    return queryset.order_by()[:cap + 1].count()
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        # Упёршийся в предел подсчёт всё равно должен давать больше
+        # одной страницы, иначе список выведет все строки разом.
+        cap = max(settings.ADMIN_COUNT_CAP, self.per_page)
+        return estimated_count(self.object_list, cap)
+
+
+class KeysetChangeList(ChangeList):
+    """Листает курсором, пока пользователь не выбрал другую сортировку."""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        keys = self.model_admin.keyset_keys
+        if not keys or ORDER_VAR in self.params or self.show_all:
+            self.cursor_page = None
+            return super().get_results(request)
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        page = CursorPaginator(
+            self.queryset, self.list_per_page, keys=keys
+        ).get_cursor_page(self.params.get(CURSOR_VAR))
+        self.cursor_page = page
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_next() or page.has_previous()
+        self.paginator = paginator
+        self.first_url = self.get_query_string(remove=[CURSOR_VAR])
+        self.next_url = self.previous_url = None
+        if page.has_next():
+            self.next_url = self.get_query_string(
+                {CURSOR_VAR: page.next_cursor}
+            )
+        if page.has_previous():
+            self.previous_url = self.get_query_string(
+                {CURSOR_VAR: page.previous_cursor}
+            )
+
+
+def chunked_pks(queryset, size):
+    """Первичные ключи queryset пачками, по ключу, а не через OFFSET."""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        chunk = list((pks if last is None else pks.filter(pk__gt=last))[
+            :size
+        ])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """ModelAdmin для больших таблиц.
+
+    keyset_keys — ключи курсора в порядке убывания, как у ленты.
+    """
+    keyset_keys = None
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ['delete_in_chunks']
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление грузит все объекты для подтверждения и
+        # удаляет их одной транзакцией.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_urls(self):
+        urls = super().get_urls()
+        for url in urls:
+            if url.name and url.name.endswith('_changelist'):
+                # Пачки действий — отдельные транзакции, а не точки
+                # сохранения внутри ATOMIC_REQUESTS.
+                transaction.non_atomic_requests(url.callback)
+        return urls
+
+    def delete_in_chunks(self, request, queryset):
+        size = settings.ADMIN_ACTION_CHUNK_SIZE
+        deleted = 0
+        for chunk in chunked_pks(queryset, size):
+            with transaction.atomic(using=queryset.db):
+                for obj in self.model.objects.filter(pk__in=chunk):
+                    self.log_deletion(request, obj, str(obj))
+                    obj.delete()
+                    deleted += 1
+        self.message_user(
+            request, f'Удалено объектов: {deleted}', messages.SUCCESS
+        )
+    delete_in_chunks.allowed_permissions = ('delete',)
+    delete_in_chunks.short_description = 'Удалить выбранные (пачками)'
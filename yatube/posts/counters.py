@@ -0,0 +1,118 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Значения хранятся в таблице Counter и обновляются сигналами в той же
+транзакции, что и сама запись. Строки заводит миграция 0015 и команда
+rebuild_counters, дальше каждая запись сдвигает счётчик одним
+INSERT ... ON CONFLICT DO UPDATE, поэтому отсутствующая строка значит
+ноль, а чтение никогда не пишет в базу.
+"""
+from collections import Counter as Deltas
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Comment, Counter, Follow, Post
+
+SITE_POSTS = 'posts'
+AUTHOR_POSTS = 'posts:author'
+GROUP_POSTS = 'posts:group'
+POST_COMMENTS = 'comments:post'
+FOLLOWERS = 'followers'
+FOLLOWING = 'following'
+
+# Как посчитать значение с нуля: имя счётчика -> (модель, поле группировки).
+SOURCES = {
+    SITE_POSTS: (Post, None),
+    AUTHOR_POSTS: (Post, 'author_id'),
+    GROUP_POSTS: (Post, 'group_id'),
+    POST_COMMENTS: (Comment, 'post_id'),
+    FOLLOWERS: (Follow, 'author_id'),
+    FOLLOWING: (Follow, 'user_id'),
+}
+
+
+def make_key(name, pk=None):
+    return name if pk is None else f'{name}:{pk}'
+
+
+def get(name, pk=None):
+    value = Counter.objects.filter(key=make_key(name, pk)).values_list(
+        'value', flat=True
+    ).first()
+    return value or 0
+
+
+def get_many(name, pks):
+    """Значения счётчика name для многих pk одним запросом."""
+    keys = {make_key(name, pk): pk for pk in pks}
+    values = dict(Counter.objects.filter(key__in=keys).values_list(
+        'key', 'value'
+    ))
+    return {pk: values.get(key, 0) for key, pk in keys.items()}
+
+
+def change(name, pk=None, delta=1):
+    """Сдвигает счётчик, заводя строку, если её ещё нет."""
+    if not delta:
+        return
+    table = connection.ops.quote_name(Counter._meta.db_table)
+    # Одна инструкция вместо UPDATE и INSERT: между ними параллельная
+    # запись потеряла бы свой сдвиг. ON CONFLICT есть в SQLite с 3.24.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (key, value) VALUES (%s, %s)'
+            f' ON CONFLICT (key) DO UPDATE SET value = {table}.value'
+            ' + excluded.value',
+            (make_key(name, pk), delta),
+        )
+
+
+def forget(name, pk=None):
+    Counter.objects.filter(key=make_key(name, pk)).delete()
+
+
+def deltas(model, objects, sign=1):
+    """Считает сдвиги всех счётчиков, которые зависят от объектов model."""
+    result = Deltas()
+    for name, (source, field) in SOURCES.items():
+        if source is not model:
+            continue
+        for obj in objects:
+            pk = None if field is None else getattr(obj, field)
+            if field is None or pk is not None:
+                result[(name, pk)] += sign
+    return result
+
+
+def apply(changes):
+    for (name, pk), delta in changes.items():
+        change(name, pk, delta)
+
+
+def bulk_created(model, objects):
+    """Учитывает объекты, созданные через bulk_create в обход сигналов."""
+    apply(deltas(model, objects))
+
+
+def rebuild(batch_size=1000):
+    """Пересчитывает все счётчики с нуля. Возвращает число строк."""
+    total = 0
+    with transaction.atomic():
+        Counter.objects.all().delete()
+        batch = []
+        for name, (model, field) in SOURCES.items():
+            if field is None:
+                rows = [(None, model.objects.count())]
+            else:
+                rows = model.objects.order_by().values_list(field).annotate(
+                    value=Count('pk')
+                ).iterator()
+            for pk, value in rows:
+                if field is not None and pk is None:
+                    continue
+                batch.append(Counter(key=make_key(name, pk), value=value))
+                if len(batch) >= batch_size:
+                    total += len(Counter.objects.bulk_create(batch))
+                    batch = []
+        total += len(Counter.objects.bulk_create(batch))
+    return total
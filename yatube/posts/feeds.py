@@ -0,0 +1,277 @@
+"""Ленты подписок: гибрид fan-out on write и чтения на лету.
+
+При публикации пост раскладывается в FeedEntry всем подписчикам автора,
+при подписке лента добирает последние посты автора, при отписке из неё
+удаляются его записи. Страница /follow/ читает одну таблицу по индексу
+(user, -pub_date, -post).
+
+Авторы, у которых подписчиков не меньше FEED_PULL_THRESHOLD, в ленты не
+раскладываются: их посты дочитываются при показе страницы и сливаются с
+материализованной лентой по pub_date. Кто из авторов читается на лету,
+записано в PulledAuthor; публикация и чтение ленты смотрят в один и тот
+же закэшированный снимок этой таблицы, поэтому пост всегда либо
+разложен, либо дочитывается. Автор переходит порог при подписке или
+отписке; вернувшемуся к раскладке ленты досыпают посты, написанные,
+пока его читали на лету. После изменения порога ленты стоит пересобрать
+командой rebuild_feeds.
+"""
+import heapq
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from core import metrics
+
+from . import counters, following
+from .models import (
+    FEED_FIELDS, Counter, FeedEntry, Follow, Post, PulledAuthor
+)
+from .paginators import CursorPaginator, keyset_condition
+
+FEED_KEYS = ('pub_date', 'post_id')
+
+
+def _entries(user_ids, posts):
+    return [
+        FeedEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def pulled_key():
+    return f'feeds:pulled:{settings.FEED_PULL_THRESHOLD}'
+
+
+def pulled_author_ids():
+    """Снимок PulledAuthor, общий для публикации и чтения лент."""
+    key = pulled_key()
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(PulledAuthor.objects.order_by(
+            'author_id'
+        ).values_list('author_id', flat=True))
+        cache.set(key, author_ids, settings.FEED_PULLED_CACHE_TIMEOUT)
+    return author_ids
+
+
+def is_pulled(author_id):
+    """Посты автора читаются на лету, а не раскладываются по лентам."""
+    return author_id in pulled_author_ids()
+
+
+def forget_pulled():
+    # Второй раз после коммита, как following.forget.
+    key = pulled_key()
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def above_threshold():
+    """Авторы, у которых подписчиков не меньше порога, по счётчикам."""
+    prefix = counters.make_key(counters.FOLLOWERS, '')
+    # Диапазон по первичному ключу вместо LIKE: ':' < ';'.
+    keys = Counter.objects.filter(
+        key__gte=prefix,
+        key__lt=prefix[:-1] + ';',
+        value__gte=settings.FEED_PULL_THRESHOLD,
+    ).values_list('key', flat=True)
+    return {int(key[len(prefix):]) for key in keys}
+
+
+def update_pulled(author_id):
+    """Переводит автора между раскладкой и чтением на лету, если число
+    его подписчиков пересекло порог."""
+    wanted = (
+        counters.get(counters.FOLLOWERS, author_id)
+        >= settings.FEED_PULL_THRESHOLD
+    )
+    pulled = PulledAuthor.objects.filter(author_id=author_id).first()
+    if wanted == (pulled is not None):
+        return
+    if wanted:
+        PulledAuthor.objects.create(author_id=author_id)
+        forget_pulled()
+        return
+    pulled.delete()
+    # Досыпаем после сброса снимка: новые посты уже раскладываются.
+    forget_pulled()
+    transaction.on_commit(
+        lambda: backfill_followers(author_id, pulled.since)
+    )
+
+
+def sync_pulled():
+    """Приводит PulledAuthor в соответствие со счётчиками и порогом.
+    Лент не трогает: вызывается перед их полной пересборкой."""
+    wanted = above_threshold()
+    current = set(PulledAuthor.objects.values_list('author_id', flat=True))
+    PulledAuthor.objects.filter(author_id__in=current - wanted).delete()
+    PulledAuthor.objects.bulk_create(
+        PulledAuthor(author_id=author_id) for author_id in wanted - current
+    )
+    forget_pulled()
+
+
+def pulled_authors(user):
+    """Авторы выше порога, на которых подписан пользователь."""
+    return following.followed_among(user, pulled_author_ids())
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        metrics.incr('feed.fan_out_skipped')
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    for user_ids in _chunks(followers.iterator(), settings.FEED_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            _entries(user_ids, [post]), ignore_conflicts=True
+        )
+        # Обрезка ленты амортизирована: не на каждой записи.
+        for user_id in user_ids:
+            if random.randrange(settings.FEED_TRIM_EVERY) == 0:
+                trim(user_id)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).only('pk', 'pub_date')[:settings.FEED_MAX_ENTRIES]
+    FeedEntry.objects.bulk_create(
+        _entries([user_id], posts), ignore_conflicts=True
+    )
+    trim(user_id)
+
+
+def backfill_followers(author_id, since):
+    """Раскладывает подписчикам посты автора, написанные с since,
+    пока его читали на лету."""
+    posts = list(Post.objects.filter(
+        author_id=author_id, pub_date__gte=since
+    ).order_by('-pub_date', '-id').only(
+        'pk', 'pub_date'
+    )[:settings.FEED_MAX_ENTRIES])
+    if not posts:
+        return
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    for user_ids in _chunks(followers.iterator(), settings.FEED_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            _entries(user_ids, posts), ignore_conflicts=True
+        )
+    metrics.incr('feed.backfilled_authors')
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim(user_id):
+    """Оставляет в ленте не больше FEED_MAX_ENTRIES последних записей."""
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    last_kept = entries.order_by('-pub_date', '-post_id').values_list(
+        *FEED_KEYS
+    )[settings.FEED_MAX_ENTRIES - 1:settings.FEED_MAX_ENTRIES].first()
+    if last_kept is not None:
+        entries.filter(keyset_condition(FEED_KEYS, last_kept)).delete()
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля по текущим подпискам."""
+    sync_pulled()
+    follows = Follow.objects.order_by('user_id')
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+    FeedEntry.objects.filter(
+        user_id__in=follows.values('user_id')
+    ).delete()
+    total = 0
+    for follow in follows.only('user_id', 'author_id').iterator():
+        backfill(follow.user_id, follow.author_id)
+        total += 1
+    return total
+
+
+class FeedPaginator(CursorPaginator):
+    """Лента подписок: материализованная часть плюс авторы выше порога.
+
+    Страницы по курсору сливают k отсортированных потоков через
+    heapq.merge; старые ссылки `?page=N` читают объединённый запрос.
+    """
+
+    def __init__(self, user, per_page, **kwargs):
+        self.entries = FeedEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'
+        ).only('pub_date', 'post', *(
+            f'post__{field}' for field in FEED_FIELDS
+        ))
+        self.pulled = pulled_authors(user)
+        posts = Post.objects.filter(
+            Q(pk__in=self.entries.values('post_id'))
+            | Q(author_id__in=self.pulled)
+        ).for_feed()
+        super().__init__(posts, per_page, **kwargs)
+
+    def _fetch_pushed(self, position, backwards, limit):
+        entries = self.entries
+        if position is not None:
+            entries = entries.filter(
+                keyset_condition(FEED_KEYS, position, backwards)
+            )
+        ordering = FEED_KEYS if backwards else [
+            f'-{key}' for key in FEED_KEYS
+        ]
+        return [entry.post for entry in entries.order_by(*ordering)[:limit]]
+
+    def _fetch_pulled(self, position, backwards, limit):
+        posts = Post.objects.filter(author_id__in=self.pulled).for_feed()
+        if position is not None:
+            posts = posts.filter(
+                keyset_condition(self.keys, position, backwards)
+            )
+        return list(posts.order_by(*self._ordering(backwards))[:limit])
+
+    def _fetch(self, position, backwards, limit):
+        metrics.gauge('feed.pull_threshold', settings.FEED_PULL_THRESHOLD)
+        pushed = self._fetch_pushed(position, backwards, limit)
+        if not self.pulled:
+            return pushed
+        pulled = self._fetch_pulled(position, backwards, limit)
+        merged, seen = [], set()
+        for post in heapq.merge(
+            pushed, pulled, key=self._position, reverse=not backwards
+        ):
+            # Пост мог попасть в ленту до того, как автор перешёл порог.
+            if post.pk not in seen:
+                seen.add(post.pk)
+                merged.append(post)
+            if len(merged) == limit:
+                break
+        metrics.incr('feed.merged_pages')
+        metrics.observe('feed.pulled_authors', len(self.pulled))
+        metrics.observe('feed.merge_rows', len(pushed) + len(pulled))
+        return merged
@@ -0,0 +1,97 @@
+"""Кэш авторов, на которых подписан пользователь.
+
+Множество хранится в кэше как отсортированный массив 32-битных id
+(четыре байта на подписку) и проверяется бинарным поиском, поэтому
+кнопка подписки на странице автора и выбор авторов для ленты обходятся
+без запросов к Follow. Подписка и отписка сбрасывают множество
+сигналами. Если подписок больше FOLLOWING_CACHE_MAX, множество не
+кэшируется и проверки идут в БД: память на пользователя ограничена.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core import metrics
+
+from .models import Follow
+
+# Пометка в кэше: подписок слишком много, спрашиваем БД.
+TOO_MANY = 'many'
+
+
+def cache_key(user_id):
+    return f'following:{user_id}'
+
+
+class FollowedSet:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __contains__(self, author_id):
+        index = bisect_left(self.ids, author_id)
+        return index < len(self.ids) and self.ids[index] == author_id
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intersection(self, author_ids):
+        return [pk for pk in author_ids if pk in self]
+
+
+def followed(user_id):
+    """FollowedSet авторов пользователя или None, если их слишком много."""
+    key = cache_key(user_id)
+    stored = cache.get(key)
+    if stored == TOO_MANY:
+        metrics.incr('following.too_many')
+        return None
+    if stored is not None:
+        metrics.incr('following.hit')
+        ids = array('I')
+        ids.frombytes(stored)
+        return FollowedSet(ids)
+    metrics.incr('following.miss')
+    limit = settings.FOLLOWING_CACHE_MAX
+    ids = array('I', Follow.objects.filter(user_id=user_id).order_by(
+        'author_id'
+    ).values_list('author_id', flat=True)[:limit + 1])
+    if len(ids) > limit:
+        cache.set(key, TOO_MANY, settings.FOLLOWING_CACHE_TIMEOUT)
+        return None
+    cache.set(key, ids.tobytes(), settings.FOLLOWING_CACHE_TIMEOUT)
+    return FollowedSet(ids)
+
+
+def is_following(user, author_id):
+    if not user.is_authenticated:
+        return False
+    authors = followed(user.pk)
+    if authors is None:
+        return Follow.objects.filter(user=user, author_id=author_id).exists()
+    return author_id in authors
+
+
+def followed_among(user, author_ids):
+    """Те из author_ids, на кого подписан пользователь."""
+    if not author_ids:
+        return []
+    authors = followed(user.pk)
+    if authors is None:
+        return list(Follow.objects.filter(
+            user=user, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+    return authors.intersection(author_ids)
+
+
+def forget(user_id):
+    # Второй раз после коммита: параллельный запрос мог успеть
+    # закэшировать множество, прочитав БД до нашей записи.
+    key = cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Post, Comment
+from .uploads import image_error
 
 
 class PostForm(forms.ModelForm):
@@ -16,6 +17,21 @@ class PostForm(forms.ModelForm):
         labels = {'group': 'Выберите подходящую группу'}
         help_texts = {'group': 'Группа'}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        image = self.files.get('image')
+        self.image_error = image and image_error(image)
+        if self.image_error:
+            # Отвергнутый файл не отдаём ImageField: тот полностью
+            # прочитал бы его Pillow ради проверки.
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.image_error:
+            raise forms.ValidationError(self.image_error)
+        return self.cleaned_data['image']
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
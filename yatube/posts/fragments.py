@@ -0,0 +1,74 @@
+"""Кэш отрисованных карточек постов.
+
+Карточка зависит от поста, имени его автора и названия группы, поэтому
+ключ — id поста, время его последнего изменения и отпечаток этих имён:
+переименование меняет ключ, а не ждёт POST_CARD_TIMEOUT. Страница ленты
+достаёт все свои карточки одним get_many и дорисовывает только
+недостающие.
+
+Комментарии от updated поста не зависят, поэтому счётчик и последние
+комментарии под карточкой рисуются отдельно от кэша карточек: число
+берётся из счётчиков, а последние комментарии — одним запросом на всю
+страницу.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import counters
+from .models import Comment
+
+FEED_CARD = 'includes/post_card.html'
+PROFILE_CARD = 'includes/profile_card.html'
+
+
+def card_key(post, template_name):
+    names = [post.author.username, post.author.get_full_name()]
+    if post.group_id is not None:
+        names += [post.group.slug, post.group.title]
+    version = hashlib.md5('\0'.join(names).encode()).hexdigest()[:12]
+    return (
+        f'card:{template_name}:{post.pk}:{post.updated.timestamp()}:{version}'
+    )
+
+
+def attach_cards(posts, template_name=FEED_CARD):
+    """Кладёт в post.card готовый HTML карточки для каждого поста."""
+    keyed = {card_key(post, template_name): post for post in posts}
+    cards = cache.get_many(keyed)
+    missing = {}
+    for key, post in keyed.items():
+        if key not in cards:
+            cards[key] = render_to_string(template_name, {'post': post})
+            # Карточку с заглушкой вместо миниатюры не кэшируем.
+            if not getattr(post, 'thumbnail_pending', False):
+                missing[key] = cards[key]
+        post.card = mark_safe(cards[key])
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+    return posts
+
+
+def attach_comment_previews(posts):
+    """Кладёт в post.comment_count число комментариев из счётчиков, а
+    в post.comment_previews — последние COMMENT_PREVIEWS из них."""
+    posts = list(posts)
+    if not posts:
+        return posts
+    previews = {post.pk: [] for post in posts}
+    for comment in Comment.objects.latest_per_post(
+        previews, settings.COMMENT_PREVIEWS
+    ):
+        previews[comment.post_id].append(comment)
+    counts = counters.get_many(counters.POST_COMMENTS, previews)
+    for post in posts:
+        post.comment_count = counts[post.pk]
+        post.comment_previews = sorted(
+            previews[post.pk],
+            key=lambda comment: (comment.created, comment.pk),
+            reverse=True,
+        )
+    return posts
@@ -0,0 +1,85 @@
+"""Хранилище ключей sorl-thumbnail с LRU в памяти процесса.
+
+Каждая карточка с картинкой спрашивает у sorl, готова ли миниатюра, и
+на странице ленты это десяток походов в кэш, а при промахе — в БД.
+Здесь перед обычным cached_db-хранилищем стоит ограниченный LRU:
+повторные проверки не выходят за пределы процесса. Записи живут не
+дольше THUMBNAIL_LRU_TIMEOUT, поэтому правки из других процессов
+видны с этой задержкой; свои правки LRU видит сразу.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+
+from core import metrics
+
+
+class LRU:
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+lru = LRU(settings.THUMBNAIL_LRU_SIZE, settings.THUMBNAIL_LRU_TIMEOUT)
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def _get_raw(self, key):
+        value = lru.get(key)
+        if value is not None:
+            metrics.incr('thumbnails.lru_hit')
+            return value
+        metrics.incr('thumbnails.lru_miss')
+        value = super()._get_raw(key)
+        # Отсутствие не запоминаем: миниатюру вот-вот сделает фоновый поток.
+        if value is not None:
+            lru.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        lru.set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        lru.delete(*keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        lru.clear()
@@ -0,0 +1,204 @@
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from core.metrics import percentile
+from posts.models import Group, Post
+from posts.seeding import Seeder
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+MEMORY_REQUESTS = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон всех маршрутов posts.urls на синтетических '
+        'данных: задержки p50/p95/p99, запросы к БД и пик памяти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='запросов на каждый маршрут')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--cold', action='store_true',
+                            help='очищать кэш перед каждым запросом')
+        parser.add_argument('--output', help='куда сохранить JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона')
+        parser.add_argument('--current-db', action='store_true',
+                            help='работать в текущей БД, а не в тестовой')
+
+    def handle(self, *args, **options):
+        # Как и тестовый раннер: без DEBUG, иначе меряем debug_toolbar.
+        # Кэш — свой файл, как в settings_test: общий читают рабочие
+        # процессы, а прогон его чистит и пишет туда ключи тестовых
+        # пользователей и страниц.
+        with tempfile.TemporaryDirectory(prefix='yatube-cache-') as directory:
+            caches = {'default': dict(
+                settings.CACHES['default'],
+                LOCATION=os.path.join(directory, 'cache.sqlite3'),
+            )}
+            with override_settings(DEBUG=False, CACHES=caches):
+                if options['current_db']:
+                    results = self.run(options)
+                else:
+                    results = self.run_in_test_db(options)
+        self.report(results, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def run_in_test_db(self, options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        self.seed(rng, options)
+        seeded = time.perf_counter() - started
+        cache.clear()
+        routes = {}
+        for name, make_request in self.scenarios(rng, options).items():
+            routes[name] = self.measure(
+                make_request, options['requests'], options['cold']
+            )
+        return {
+            'options': {
+                key: options[key] for key in (
+                    'users', 'groups', 'posts', 'comments', 'follows',
+                    'requests', 'seed', 'cold',
+                )
+            },
+            'seed_seconds': round(seeded, 3),
+            'routes': routes,
+        }
+
+    def seed(self, rng, options):
+        call_command(
+            'seed_yatube', users=options['users'], groups=options['groups'],
+            posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], seed=options['seed'],
+            stdout=StringIO(),
+        )
+
+    def scenarios(self, rng, options):
+        users = list(User.objects.filter(
+            username__startswith=Seeder(options['seed']).prefix
+        ))
+        groups = list(Group.objects.values_list('slug', flat=True))
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        reader = Client()
+        reader.force_login(rng.choice(users))
+        guest = Client()
+
+        def follow_toggle():
+            username = rng.choice(users).username
+            reader.get(reverse('posts:profile_follow',
+                               kwargs={'username': username}))
+            return reader.get(reverse('posts:profile_unfollow',
+                                      kwargs={'username': username}))
+
+        return {
+            'index': lambda: guest.get(reverse('posts:index')),
+            'group_list': lambda: guest.get(reverse(
+                'posts:group_list', kwargs={'slug': rng.choice(groups)}
+            )),
+            'profile': lambda: reader.get(reverse(
+                'posts:profile',
+                kwargs={'username': rng.choice(users).username}
+            )),
+            'post_detail': lambda: guest.get(reverse(
+                'posts:post_detail', kwargs={'post_id': rng.choice(post_ids)}
+            )),
+            'follow_index': lambda: reader.get(reverse('posts:follow_index')),
+            'post_create': lambda: reader.post(
+                reverse('posts:post_create'), {'text': 'Новый пост'}
+            ),
+            'add_comment': lambda: reader.post(
+                reverse('posts:add_comment',
+                        kwargs={'post_id': rng.choice(post_ids)}),
+                {'text': 'Новый комментарий'}
+            ),
+            'follow_unfollow': follow_toggle,
+        }
+
+    def measure(self, make_request, requests, cold):
+        latencies, queries, statuses = [], [], set()
+        for _ in range(requests):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = make_request()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+        # Память меряем отдельным коротким прогоном: tracemalloc сильно
+        # замедляет интерпретатор и исказил бы задержки.
+        tracemalloc.start()
+        for _ in range(min(requests, MEMORY_REQUESTS)):
+            make_request()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result = {
+            f'p{percent}_ms': round(percentile(latencies, percent), 3)
+            for percent in PERCENTILES
+        }
+        result.update({
+            'mean_queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'statuses': sorted(statuses),
+        })
+        return result
+
+    def report(self, results, compare=None):
+        previous = {}
+        if compare:
+            with open(compare) as baseline:
+                previous = json.load(baseline)['routes']
+        self.stdout.write(
+            f'{"маршрут":<16}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"запросы":>9}{"память КБ":>11}'
+        )
+        for name, route in results['routes'].items():
+            line = (
+                f'{name:<16}{route["p50_ms"]:>9.2f}{route["p95_ms"]:>9.2f}'
+                f'{route["p99_ms"]:>9.2f}{route["mean_queries"]:>9.1f}'
+                f'{route["peak_memory_kb"]:>11.1f}'
+            )
+            if name in previous:
+                before = previous[name]['p95_ms']
+                change = (route['p95_ms'] - before) / before * 100
+                line += f'  p95 {change:+.1f}%'
+            self.stdout.write(line)
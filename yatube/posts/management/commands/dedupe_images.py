@@ -0,0 +1,87 @@
+import os
+import shutil
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from posts import thumbnails
+from posts.models import Post
+from posts.signals import bump_pages
+from posts.storage import is_content_name, lock_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Переименовывает картинки постов по содержимому и удаляет '
+        'копии одинаковых файлов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только посчитать, ничего не менять')
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        storage = field.storage
+        dry_run = options['dry_run']
+        files = merged = saved = 0
+        author_ids, group_ids = set(), set()
+        for name in self.walk(storage, field.upload_to.rstrip('/')):
+            if is_content_name(name):
+                continue
+            files += 1
+            with storage.open(name) as content:
+                target = storage.content_name(name, File(content))
+            size = storage.size(name)
+            duplicate = storage.exists(target)
+            if duplicate:
+                merged += 1
+                saved += size
+            if dry_run:
+                continue
+            # Сначала БД, потом файлы: если команда упадёт посередине,
+            # посты уже указывают на существующий файл, а старый
+            # останется лишней копией до следующего запуска.
+            posts = Post.objects.filter(image=name)
+            with transaction.atomic():
+                lock_name(target)
+                if not storage.exists(target):
+                    self.copy(storage.path(name), storage.path(target))
+                for author_id, group_id in posts.values_list(
+                    'author_id', 'group_id'
+                ):
+                    author_ids.add(author_id)
+                    group_ids.add(group_id)
+                # updated меняем, чтобы сбросить кэш карточек.
+                posts.update(image=target, updated=timezone.now())
+            # Имена не по содержимому новые загрузки не получают,
+            # так что ссылок на старый файл больше нет.
+            thumbnails.forget(name)
+            os.remove(storage.path(name))
+        if author_ids:
+            bump_pages(author_ids, group_ids)
+        prefix = 'Можно сэкономить' if dry_run else 'Сэкономлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов: {files}, копий: {merged}. '
+            f'{prefix}: {filesizeformat(saved)} ({saved} байт)'
+        ))
+
+    def copy(self, source, target):
+        # Через временный файл: под именем по содержимому не должно
+        # оказаться недописанного файла.
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f'{target}.tmp'
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in sorted(files):
+            yield f'{directory}/{name}'
+        for name in sorted(directories):
+            yield from self.walk(storage, f'{directory}/{name}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, посты, комментарии и подписки '
+        'в каталог, по файлу на вид данных'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            default='jsonl')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        counts = transfer.export(
+            options['directory'],
+            fmt=options['format'],
+            chunk_size=options['chunk_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Выгружено: ' + ', '.join(
+                f'{kind} {total}' for kind, total in counts.items()
+            )
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, feeds, transfer
+from posts.signals import bump_pages
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает данные, выгруженные export_yatube. Повторный запуск '
+        'после обрыва продолжает с контрольной точки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            default='jsonl')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='не снимать индексы на время загрузки')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='не пересчитывать счётчики и ленты')
+
+    def handle(self, *args, **options):
+        importer = transfer.Importer(
+            options['directory'],
+            fmt=options['format'],
+            chunk_size=options['chunk_size'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        try:
+            importer.run(defer_indexes=not options['keep_indexes'])
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f'Загрузка прервана: {error!r}')
+        if not options['skip_derived']:
+            # bulk_create обходит сигналы: счётчики и ленты собираем сами.
+            counters.rebuild()
+            feeds.rebuild()
+        bump_pages(importer.author_ids, importer.group_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, записано строк: {importer.written}'
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters, feeds
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками. Повторный запуск с тем же --seed '
+        'продолжает с места обрыва'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=2000000)
+        parser.add_argument('--follows', type=int, default=200000,
+                            help='примерное общее число подписок')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--rate', type=float,
+                            help='не больше стольких строк в секунду')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='показатель распределения Ципфа')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='не пересчитывать счётчики и ленты')
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            rate=options['rate'],
+            exponent=options['zipf'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        seeder.run(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+        )
+        if not options['skip_derived']:
+            # bulk_create обходит сигналы: счётчики и ленты собираем сами.
+            counters.rebuild()
+            feeds.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, записано строк: {seeder.written}'
+        ))
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count
+
+# Копия posts.counters.SOURCES на момент миграции: имя счётчика ->
+# (модель, поле группировки).
+SOURCES = {
+    'posts': ('Post', None),
+    'posts:author': ('Post', 'author_id'),
+    'posts:group': ('Post', 'group_id'),
+    'comments:post': ('Comment', 'post_id'),
+    'followers': ('Follow', 'author_id'),
+    'following': ('Follow', 'user_id'),
+}
+
+
+def fill(apps, schema_editor):
+    """Заводит строки всех счётчиков: раньше они досчитывались при
+    первом чтении, теперь отсутствующая строка означает ноль."""
+    Counter = apps.get_model('posts', 'Counter')
+    Counter.objects.all().delete()
+    batch = []
+    for name, (model_name, field) in SOURCES.items():
+        model = apps.get_model('posts', model_name)
+        if field is None:
+            rows = [(None, model.objects.count())]
+        else:
+            rows = model.objects.order_by().values_list(field).annotate(
+                value=Count('pk')
+            ).iterator()
+        for pk, value in rows:
+            if field is None:
+                batch.append(Counter(key=name, value=value))
+            elif pk is not None:
+                batch.append(Counter(key=f'{name}:{pk}', value=value))
+    Counter.objects.bulk_create(batch, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
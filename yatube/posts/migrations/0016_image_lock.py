@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_fill_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageLock',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Блокировка картинки',
+                'verbose_name_plural': 'Блокировки картинок',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill(apps, schema_editor):
+    """Авторы, которые сейчас выше порога, уже читаются на лету."""
+    Counter = apps.get_model('posts', 'Counter')
+    PulledAuthor = apps.get_model('posts', 'PulledAuthor')
+    prefix = 'followers:'
+    keys = Counter.objects.filter(
+        key__gte=prefix,
+        key__lt=prefix[:-1] + ';',
+        value__gte=settings.FEED_PULL_THRESHOLD,
+    ).values_list('key', flat=True)
+    PulledAuthor.objects.bulk_create(
+        PulledAuthor(author_id=int(key[len(prefix):])) for key in keys
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0016_image_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('since', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Автор без раскладки',
+                'verbose_name_plural': 'Авторы без раскладки',
+            },
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
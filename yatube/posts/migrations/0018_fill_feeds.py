@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def fill(apps, schema_editor):
+    """Раскладывает по лентам посты уже существующих подписок: /follow/
+    читает только FeedEntry и без этого пуст до ручного rebuild_feeds.
+
+    Как backfill с последующей обрезкой: каждому подписчику — последние
+    FEED_MAX_ENTRIES постов его авторов, кроме читаемых на лету.
+    """
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    PulledAuthor = apps.get_model('posts', 'PulledAuthor')
+    FeedEntry.objects.all().delete()
+    user_ids = Follow.objects.order_by('user_id').values_list(
+        'user_id', flat=True
+    ).distinct()
+    for user_id in user_ids.iterator():
+        posts = Post.objects.filter(
+            author_id__in=Follow.objects.filter(
+                user_id=user_id
+            ).values('author_id')
+        ).exclude(
+            author_id__in=PulledAuthor.objects.values('author_id')
+        ).order_by('-pub_date', '-id').values_list(
+            'pk', 'pub_date'
+        )[:settings.FEED_MAX_ENTRIES]
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_pulled_author'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
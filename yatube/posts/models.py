@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -13,9 +15,58 @@ class Group(models.Model):
         return f'{self.title}'
 
 
+# Всё, что карточки постов берут из поста, автора и группы.
+FEED_FIELDS = (
+    'text', 'pub_date', 'updated', 'image',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__title', 'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент и карточек: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        """Комментарии под постом вместе с именами их авторов."""
+        return self.select_related('author').only(
+            'post_id', 'text', 'created', 'author__username'
+        )
+
+    def latest_per_post(self, post_ids, limit):
+        """Не больше limit последних комментариев к каждому из постов
+        одним запросом.
+
+        Подзапрос с LIMIT коррелирован с постом и идёт по индексу
+        comment_post_created_idx, поэтому читает не больше limit строк
+        на пост, сколько бы комментариев у него ни было.
+        """
+        post_ids = list(post_ids)
+        comments = self.model._meta.db_table
+        return self.raw(
+            'SELECT comment.id, comment.post_id, comment.author_id,'
+            ' comment.text, comment.created,'
+            ' author.username AS author_username'
+            f' FROM {Post._meta.db_table} AS post'
+            f' INNER JOIN {comments} AS comment ON comment.id IN ('
+            f' SELECT latest.id FROM {comments} AS latest'
+            ' WHERE latest.post_id = post.id'
+            ' ORDER BY latest.created DESC, latest.id DESC LIMIT %s)'
+            f' INNER JOIN {User._meta.db_table} AS author'
+            ' ON author.id = comment.author_id'
+            f' WHERE post.id IN ({", ".join(["%s"] * len(post_ids))})',
+            (limit, *post_ids),
+        )
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(auto_now_add=True)
+    # Версия поста для кэша фрагментов, см. posts/fragments.py.
+    updated = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -29,12 +80,26 @@ class Post(models.Model):
         related_name='posts')
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        # Индекс нужен подсчёту ссылок на общий файл.
+        db_index=True,
         blank=True,
         null=True
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ["-pub_date"]
+        # Порядок ленты — (-pub_date, -id): id разрешает равные даты.
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -60,8 +125,14 @@ class Comment(models.Model):
 
     created = models.DateTimeField('Дата публикации', auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -85,8 +156,92 @@ class Follow(models.Model):
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_follow')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return f'{self.user}'
+
+
+class Counter(models.Model):
+    """Денормализованный счётчик, например `posts:author:5`."""
+    key = models.CharField(primary_key=True, max_length=64)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Счётчик'
+        verbose_name_plural = 'Счётчики'
+
+    def __str__(self):
+        return f'{self.key}={self.value}'
+
+
+class FeedEntry(models.Model):
+    """Строка материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    # Копия post.pub_date: лента читается одним проходом по индексу.
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class ImageLock(models.Model):
+    """Строка-блокировка файла картинки поста.
+
+    Загрузка и удаление общего файла берут блокировку строки до конца
+    своей транзакции, см. posts/storage.py.
+    """
+    name = models.CharField(primary_key=True, max_length=255)
+
+    class Meta:
+        verbose_name = 'Блокировка картинки'
+        verbose_name_plural = 'Блокировки картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class PulledAuthor(models.Model):
+    """Автор, чьи посты ленты подписок читают на лету, а не получают
+    раскладкой; см. posts/feeds.py."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+    # С этого момента посты автора не раскладывались по лентам.
+    since = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Автор без раскладки'
+        verbose_name_plural = 'Авторы без раскладки'
+
+    def __str__(self):
+        return f'{self.author_id}'
@@ -0,0 +1,158 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import counters
+
+
+def encode_cursor(position, backwards=False):
+    """Упаковывает позицию в ленте в непрозрачный токен для `?cursor=`."""
+    payload = json.dumps(
+        {'p': list(position), 'b': int(backwards)},
+        # Не DjangoJSONEncoder: тот обрезает микросекунды у datetime.
+        default=lambda value: value.isoformat(),
+        separators=(',', ':'),
+    )
+    token = base64.urlsafe_b64encode(payload.encode())
+    return token.decode().rstrip('=')
+
+
+# Целые в позиции должны помещаться в INTEGER базы, иначе драйвер падает
+# с OverflowError.
+MAX_INT = 2 ** 63 - 1
+
+
+def position_value(value, kind):
+    """Значение позиции типа kind или None, если оно не подходит."""
+    if isinstance(value, bool):
+        return None
+    if kind is datetime:
+        return parse_datetime(value) if isinstance(value, str) else None
+    if isinstance(value, int) and -MAX_INT - 1 <= value <= MAX_INT:
+        return value if kind is int else float(value)
+    if kind is float and isinstance(value, float) and math.isfinite(value):
+        return value
+    return None
+
+
+def decode_cursor(token, types=(datetime, int)):
+    """Возвращает (позиция, назад) или (None, False) для битого токена.
+
+    Позиция должна состоять из значений типов types по порядку.
+    """
+    if not token:
+        return None, False
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload['p']
+        if not isinstance(values, list) or len(values) != len(types):
+            return None, False
+        position = tuple(
+            position_value(value, kind) for value, kind in zip(values, types)
+        )
+        backwards = bool(payload['b'])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None, False
+    if None in position:
+        return None, False
+    return position, backwards
+
+
+def keyset_condition(keys, position, backwards=False):
+    """Условие «строго после позиции» для убывающей сортировки по keys."""
+    lookup = 'gt' if backwards else 'lt'
+    condition = Q()
+    for index, key in enumerate(keys):
+        equal = dict(zip(keys[:index], position[:index]))
+        equal[f'{key}__{lookup}'] = position[index]
+        condition |= Q(**equal)
+    return condition
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) вместо LIMIT/OFFSET.
+
+    Время выдачи страницы по курсору не зависит от её глубины и не
+    требует COUNT(*). Номера страниц (`?page=N`) по-прежнему работают
+    через обычный Paginator, чтобы не ломать старые ссылки.
+    """
+
+    # Типы ключей по порядку: токен с другими значениями считается битым.
+    key_types = (datetime, int)
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 **kwargs):
+        self.keys = tuple(keys)
+        if isinstance(object_list, QuerySet):
+            object_list = object_list.order_by(*self._ordering())
+        super().__init__(object_list, per_page, **kwargs)
+
+    def _ordering(self, backwards=False):
+        if backwards:
+            return self.keys
+        return tuple(f'-{key}' for key in self.keys)
+
+    def _position(self, obj):
+        return tuple(getattr(obj, key) for key in self.keys)
+
+    def _fetch(self, position, backwards, limit):
+        queryset = self.object_list
+        if position is not None:
+            queryset = queryset.filter(
+                keyset_condition(self.keys, position, backwards)
+            )
+        return list(queryset.order_by(*self._ordering(backwards))[:limit])
+
+    def get_cursor_page(self, cursor=None):
+        position, backwards = decode_cursor(cursor, self.key_types)
+        try:
+            rows = self._fetch(position, backwards, self.per_page + 1)
+        except (ValidationError, ValueError, TypeError):
+            if position is None:
+                raise
+            return self.get_cursor_page()
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards and not has_more:
+            # Дошли до начала ленты — отдаём первую страницу целиком.
+            return self.get_cursor_page()
+        if backwards:
+            rows.reverse()
+        next_cursor = previous_cursor = None
+        if rows and (has_more or backwards):
+            next_cursor = encode_cursor(self._position(rows[-1]))
+        if rows and position is not None:
+            previous_cursor = encode_cursor(self._position(rows[0]), True)
+        return self._cursor_page(rows, next_cursor, previous_cursor)
+
+    def _cursor_page(self, rows, next_cursor, previous_cursor):
+        # Тип страницы остаётся обычным Page (на это завязаны шаблоны и
+        # тесты), но без номера: навигация строится только по курсорам.
+        page = Page(rows, None, self)
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        page.has_next = lambda: next_cursor is not None
+        page.has_previous = lambda: previous_cursor is not None
+        return page
+
+
+class CountedPaginator(CursorPaginator):
+    """Берёт число объектов из денормализованного счётчика, а не COUNT(*)."""
+
+    def __init__(self, object_list, per_page, counter, **kwargs):
+        self.counter = counter
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return counters.get(*self.counter)
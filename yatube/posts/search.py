@@ -0,0 +1,122 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite поиск идёт по FTS5-таблице posts_post_fts (см. миграцию
+0014_post_search), результаты упорядочены по bm25: чем меньше, тем
+ближе. Ранжируются только самые свежие SEARCH_MAX_CANDIDATES
+совпадений, поэтому время запроса не растёт вместе с базой. Выдача
+листается курсором по (bm25, id), как и ленты. На других базах
+остаётся обычный icontains по свежести.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Post
+from .paginators import CursorPaginator
+
+TERM = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение FTS5: все слова, последнее — по
+    префиксу. Кавычки не дают словам стать операторами FTS5."""
+    terms = TERM.findall(query)[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def match_condition(expression):
+    """Условие WHERE для QuerySet.extra: пост подходит под выражение.
+
+    Не RawSQL в pk__in: Django обернул бы подзапрос во вторые скобки, и
+    SQLite сравнил бы id только с первой строкой подзапроса.
+    """
+    return (
+        'posts_post.id IN (SELECT rowid FROM posts_post_fts '
+        'WHERE posts_post_fts MATCH %s)',
+        [expression],
+    )
+
+
+def rebuild():
+    """Перестраивает индекс по текущему содержимому posts_post."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('optimize')"
+        )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная выдача поиска, лучшие совпадения первыми."""
+
+    key_types = (float, int)
+
+    def __init__(self, query, per_page, **kwargs):
+        self.expression = match_expression(query)
+        self.query = query
+        super().__init__([], per_page, keys=('search_rank', 'id'), **kwargs)
+
+    def _fetch(self, position, backwards, limit):
+        if self.expression is None:
+            return []
+        if not available():
+            return self._fetch_fallback(position, backwards, limit)
+        # bm25 считается для каждого совпадения, и сортировка всех
+        # совпадений частого слова на миллионах постов заняла бы секунды.
+        # Ранжируем только SEARCH_MAX_CANDIDATES самых свежих: обход
+        # индекса по rowid DESC их находит, не трогая остальные.
+        sql = [
+            'SELECT rowid, score FROM (',
+            'SELECT rowid, bm25(posts_post_fts) AS score',
+            'FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+            'ORDER BY rowid DESC LIMIT %s)',
+        ]
+        params = [self.expression, settings.SEARCH_MAX_CANDIDATES]
+        if position is not None:
+            # Позиция уже проверена по key_types: float и целое в 64 битах,
+            # поэтому её можно отдавать параметрами как есть.
+            # Вперёд — к большим score, то есть к худшим совпадениям.
+            sign = '<' if backwards else '>'
+            sql.append(
+                f'WHERE score {sign} %s OR (score = %s AND rowid {sign} %s)'
+            )
+            params += [position[0], position[0], position[1]]
+        order = 'DESC' if backwards else 'ASC'
+        sql.append(f'ORDER BY score {order}, rowid {order} LIMIT %s')
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            ranked = cursor.fetchall()
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in ranked])
+        rows = []
+        for pk, score in ranked:
+            if pk in posts:
+                posts[pk].search_rank = score
+                rows.append(posts[pk])
+        return rows
+
+    def _fetch_fallback(self, position, backwards, limit):
+        posts = Post.objects.for_feed()
+        for term in TERM.findall(self.query)[:MAX_TERMS]:
+            posts = posts.filter(text__icontains=term)
+        if position is not None:
+            lookup = 'gt' if backwards else 'lt'
+            posts = posts.filter(**{f'id__{lookup}': position[1]})
+        rows = list(posts.order_by('id' if backwards else '-id')[:limit])
+        for post in rows:
+            post.search_rank = 0
+        return rows
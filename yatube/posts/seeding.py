@@ -0,0 +1,259 @@
+"""Генератор синтетических данных для нагрузочных прогонов.
+
+Всё, что создаётся, однозначно определяется зерном: каждая пачка строк
+берёт свой генератор случайных чисел из (зерно, вид, номер пачки).
+Пачка пишется одной транзакцией, поэтому после обрыва уже записанное
+находится подсчётом строк и генерация продолжается со следующей пачки,
+давая те же данные, что и прогон без обрыва.
+
+Распределения приближены к живому сайту: авторы постов выбираются по
+Ципфу, число подписок на пользователя — степенное, подписываются чаще
+на популярных, а комментарии приходят всплесками к отдельным постам.
+"""
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from faker import Faker
+
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+PERIOD = timedelta(days=365)
+BURST_PROBABILITY = 0.3
+BURST_LENGTH = 50
+
+
+@contextmanager
+def explicit_dates():
+    """Разрешает задать pub_date/updated/created при bulk_create."""
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Post._meta.get_field('updated'),
+        Comment._meta.get_field('created'),
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для rng.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Seeder:
+    def __init__(self, seed=1, chunk_size=5000, rate=None, exponent=1.1,
+                 log=None):
+        self.seed = seed
+        self.prefix = f'seed{seed}_'
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.exponent = exponent
+        self.log = log or (lambda message: None)
+        self.written = 0
+        self.started = time.monotonic()
+
+    def rng(self, kind, chunk):
+        return random.Random(f'{self.seed}:{kind}:{chunk}')
+
+    def faker(self, kind, chunk):
+        fake = Faker('ru_RU')
+        fake.seed_instance(f'{self.seed}:{kind}:{chunk}')
+        return fake
+
+    def moment(self, rng):
+        return START + PERIOD * rng.random()
+
+    def throttle(self, rows):
+        """Держит среднюю скорость записи не выше rate строк в секунду."""
+        self.written += rows
+        if self.rate:
+            ahead = self.written / self.rate - (
+                time.monotonic() - self.started
+            )
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def chunks(self, kind, total, done):
+        """Номера и границы ещё не записанных пачек."""
+        for chunk in range(done // self.chunk_size,
+                           -(-total // self.chunk_size)):
+            start = chunk * self.chunk_size
+            stop = min(start + self.chunk_size, total)
+            if stop > done:
+                yield chunk, start, stop
+
+    def write(self, kind, model, total, done, build):
+        """build(chunk, start, stop) отдаёт по списку строк на единицу:
+        пост, комментарий или все подписки одного пользователя."""
+        for chunk, start, stop in self.chunks(kind, total, done):
+            units = build(chunk, start, stop)[max(0, done - start):]
+            rows = [row for unit in units for row in unit]
+            with transaction.atomic():
+                model.objects.bulk_create(rows)
+            self.throttle(len(rows))
+            self.log(f'{kind}: {stop}/{total}')
+
+    def run(self, users, groups, posts, comments, follows):
+        with explicit_dates():
+            self.seed_users(users)
+            self.seed_groups(groups)
+            user_ids = self.user_ids()
+            group_ids = self.group_ids()
+            self.seed_posts(posts, user_ids, group_ids)
+            self.seed_comments(comments, user_ids)
+            self.seed_follows(follows, user_ids)
+
+    def user_ids(self):
+        rows = User.objects.filter(
+            username__startswith=self.prefix
+        ).values_list('username', 'pk')
+        ids = dict(rows)
+        return [ids[f'{self.prefix}{i}'] for i in range(len(ids))]
+
+    def group_ids(self):
+        return list(Group.objects.filter(
+            slug__startswith=self.prefix.replace('_', '-')
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def seed_users(self, total):
+        def build(chunk, start, stop):
+            fake = self.faker('users', chunk)
+            return [
+                [User(
+                    username=f'{self.prefix}{i}',
+                    first_name=fake.first_name(),
+                    last_name=fake.last_name(),
+                    password='!',
+                )]
+                for i in range(start, stop)
+            ]
+        done = User.objects.filter(username__startswith=self.prefix).count()
+        self.write('users', User, total, done, build)
+
+    def seed_groups(self, total):
+        slug = self.prefix.replace('_', '-')
+
+        def build(chunk, start, stop):
+            fake = self.faker('groups', chunk)
+            return [
+                [Group(
+                    title=f'{fake.word().capitalize()} {i}',
+                    slug=f'{slug}{i}',
+                    description=fake.sentence(),
+                )]
+                for i in range(start, stop)
+            ]
+        done = Group.objects.filter(slug__startswith=slug).count()
+        self.write('groups', Group, total, done, build)
+
+    def seed_posts(self, total, user_ids, group_ids):
+        weights = zipf_weights(len(user_ids), self.exponent)
+        groups = group_ids + [None]
+
+        def build(chunk, start, stop):
+            rng = self.rng('posts', chunk)
+            fake = self.faker('posts', chunk)
+            authors = rng.choices(user_ids, cum_weights=weights,
+                                  k=stop - start)
+            rows = []
+            for author_id in authors:
+                pub_date = self.moment(rng)
+                rows.append([Post(
+                    author_id=author_id,
+                    group_id=rng.choice(groups),
+                    text=fake.text(max_nb_chars=300),
+                    pub_date=pub_date,
+                    updated=pub_date,
+                )])
+            return rows
+        done = Post.objects.filter(
+            author__username__startswith=self.prefix
+        ).count()
+        self.write('posts', Post, total, done, build)
+
+    def seed_comments(self, total, user_ids):
+        posts = list(Post.objects.filter(
+            author__username__startswith=self.prefix
+        ).order_by('pk').values_list('pk', 'pub_date'))
+        if not posts:
+            return
+        weights = zipf_weights(len(posts), self.exponent)
+
+        def build(chunk, start, stop):
+            rng = self.rng('comments', chunk)
+            fake = self.faker('comments', chunk)
+            rows = []
+            burst = None
+            for i in range(start, stop):
+                if burst is None or i % BURST_LENGTH == 0:
+                    # Новый всплеск: обсуждение одного поста.
+                    burst = rng.choices(posts, cum_weights=weights)[0]
+                if rng.random() < BURST_PROBABILITY:
+                    post_id, pub_date = burst
+                else:
+                    post_id, pub_date = rng.choice(posts)
+                rows.append([Comment(
+                    post_id=post_id,
+                    author_id=rng.choice(user_ids),
+                    text=fake.sentence(),
+                    created=pub_date + timedelta(minutes=rng.expovariate(
+                        1 / 60
+                    )),
+                )])
+            return rows
+        done = Comment.objects.filter(
+            author__username__startswith=self.prefix
+        ).count()
+        self.write('comments', Comment, total, done, build)
+
+    def seed_follows(self, total, user_ids):
+        """Подписки пишутся по подписчикам: у каждого хотя бы одна."""
+        if len(user_ids) < 2:
+            return
+        weights = zipf_weights(len(user_ids), self.exponent)
+        mean = max(1, total // len(user_ids))
+        # Парето с минимумом 1 и средним около mean.
+        alpha = mean / (mean - 1) if mean > 1 else 10.0
+
+        def build(chunk, start, stop):
+            rng = self.rng('follows', chunk)
+            rows = []
+            for index in range(start, stop):
+                user_id = user_ids[index]
+                wanted = min(int(rng.paretovariate(alpha)),
+                             len(user_ids) // 2 or 1)
+                authors = set()
+                # Популярных выбираем по Ципфу; если хвост длинный,
+                # добираем равномерно, чтобы не крутиться впустую.
+                for _ in range(wanted * 20):
+                    if len(authors) == wanted:
+                        break
+                    authors.add(rng.choices(user_ids, cum_weights=weights)[0])
+                    authors.discard(user_id)
+                while len(authors) < wanted:
+                    authors.add(rng.choice(user_ids))
+                    authors.discard(user_id)
+                rows.append([
+                    Follow(user_id=user_id, author_id=author_id)
+                    for author_id in sorted(authors)
+                ])
+            return rows
+        done = Follow.objects.filter(
+            user__username__startswith=self.prefix
+        ).values('user_id').distinct().count()
+        self.write('follows', Follow, len(user_ids), done, build)
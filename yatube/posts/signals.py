@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_save
+)
+from django.dispatch import receiver
+
+from . import caching, counters, feeds, following, thumbnails
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+COUNTED_FIELDS = ('author_id', 'group_id')
+# Поля автора, которые видны в карточках его постов.
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _remember(post):
+    # Берём из __dict__, чтобы не дёргать БД ради отложенных полей.
+    post._counted = {
+        field: post.__dict__[field]
+        for field in COUNTED_FIELDS if field in post.__dict__
+    }
+    post._image_name = _image_name(post)
+
+
+def _image_name(post):
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image) or None
+
+
+def _previous(post):
+    values = {field: getattr(post, field) for field in COUNTED_FIELDS}
+    values.update(post._counted)
+    return SimpleNamespace(**values)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    _remember(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = _previous(instance)
+    changes = counters.deltas(Post, [instance])
+    if not created:
+        changes.subtract(counters.deltas(Post, [previous]))
+    counters.apply(changes)
+    bump_pages(
+        {instance.author_id, previous.author_id},
+        {instance.group_id, previous.group_id},
+    )
+    old_image = instance._image_name
+    if old_image and old_image != _image_name(instance):
+        thumbnails.release(old_image)
+    _remember(instance)
+    if created:
+        feeds.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.apply(counters.deltas(Post, [instance], -1))
+    counters.forget(counters.POST_COMMENTS, instance.pk)
+    bump_pages([instance.author_id], [instance.group_id])
+    if _image_name(instance):
+        thumbnails.release(_image_name(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Follow)
+def relation_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.apply(counters.deltas(sender, [instance]))
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Follow)
+def relation_deleted(sender, instance, **kwargs):
+    counters.apply(counters.deltas(sender, [instance], -1))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        following.forget(instance.user_id)
+        feeds.update_pulled(instance.author_id)
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    following.forget(instance.user_id)
+    feeds.update_pulled(instance.author_id)
+    feeds.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    counters.forget(counters.GROUP_POSTS, instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    for name in (counters.AUTHOR_POSTS, counters.FOLLOWERS,
+                 counters.FOLLOWING):
+        counters.forget(name, instance.pk)
+
+
+def bump_pages(author_ids=(), group_ids=(), site=True):
+    """Сбрасывает кэш лент, где могли быть показаны посты этих авторов
+    и групп."""
+    if site:
+        caching.bump(caching.SITE)
+    group_ids = [pk for pk in group_ids if pk is not None]
+    if group_ids:
+        for slug in Group.objects.filter(pk__in=group_ids).values_list(
+            'slug', flat=True
+        ):
+            caching.bump(caching.GROUP, slug)
+    for username in User.objects.filter(pk__in=author_ids).values_list(
+        'username', flat=True
+    ):
+        caching.bump(caching.AUTHOR, username)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        bump_pages([post['author_id']], [post['group_id']])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    # Число подписчиков и кнопка подписки на странице автора.
+    bump_pages([instance.author_id], site=False)
+
+
+@receiver(pre_save, sender=Group)
+def group_renamed(sender, instance, **kwargs):
+    if instance.pk is not None:
+        bump_pages(group_ids=[instance.pk], site=False)
+
+
+@receiver(pre_save, sender=User)
+def user_renamed(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Вход в систему сохраняет только last_login: лишний запрос не нужен.
+    if raw or instance.pk is None or (
+        update_fields is not None and not set(update_fields) & set(NAME_FIELDS)
+    ):
+        return
+    names = User.objects.filter(pk=instance.pk).values_list(
+        *NAME_FIELDS
+    ).first()
+    if names is None or names == tuple(
+        getattr(instance, field) for field in NAME_FIELDS
+    ):
+        return
+    # Карточки сменят ключ сами, а страницы лент с ними надо сбросить.
+    bump_pages([instance.pk], Post.objects.filter(
+        author_id=instance.pk
+    ).order_by().values_list('group_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    caching.bump(caching.GROUP, instance.slug)
@@ -0,0 +1,76 @@
+"""Хранилище картинок постов с именами по содержимому.
+
+Файл называется по sha256 своего содержимого, поэтому повторная
+загрузка той же картинки не создаёт ни нового файла, ни новых
+миниатюр: sorl находит их по тому же имени. Один файл может быть у
+нескольких постов; удаляется он, когда на него не ссылается ни один
+пост, см. thumbnails.release.
+
+Проверка «файл уже есть» при загрузке и удаление файла уборкой идут
+под блокировкой строки ImageLock с именем файла. Она держится до конца
+транзакции, поэтому уборка не удалит файл, который только что
+переиспользовала ещё не закоммиченная загрузка, а дождётся её.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK = 64 * 1024
+CONTENT_NAME = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_name(name):
+    return CONTENT_NAME.search(name) is not None
+
+
+def lock_name(name):
+    """Блокирует имя файла до конца текущей транзакции."""
+    from .models import ImageLock
+
+    table = connection.ops.quote_name(ImageLock._meta.db_table)
+    # DO UPDATE, а не DO NOTHING: PostgreSQL блокирует строку только
+    # при обновлении. SQLite и так берёт блокировку записи на всю базу.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name) VALUES (%s)'
+            ' ON CONFLICT (name) DO UPDATE SET name = excluded.name',
+            (name,),
+        )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        """posts/ab/ab12…ef.gif для файла name с данным содержимым."""
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            # Такая картинка уже есть — пост просто сошлётся на неё.
+            return name
+        return super().save(name, content, max_length)
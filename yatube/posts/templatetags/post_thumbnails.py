@@ -0,0 +1,18 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, name):
+    """Миниатюра, если она уже готова, иначе None.
+
+    Пока миниатюры нет, пост помечается, чтобы карточку с заглушкой
+    не положили в кэш.
+    """
+    thumbnail = thumbnails.cached(image, name)
+    if image and thumbnail is None:
+        image.instance.thumbnail_pending = True
+    return thumbnail
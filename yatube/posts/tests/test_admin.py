@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.changelist import estimated_count
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(ADMIN_COUNT_CAP=5)
+class ScalableAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.bulk_create(
+            Post(author=cls.admin, group=cls.group, text=f'Пост {i}')
+            for i in range(250)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model='post', **params):
+        return self.client.get(
+            reverse(f'admin:posts_{model}_changelist'), params
+        )
+
+    def test_counts_are_capped_or_estimated(self):
+        self.assertEqual(
+            estimated_count(Post.objects.filter(group=self.group), 5), 6
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_count(Post.objects.all(), 5), 250)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.changelist()
+        with CaptureQueriesContext(connection) as small:
+            self.changelist()
+        author = User.objects.create_user('author')
+        for i in range(20):
+            Comment.objects.create(
+                post=Post.objects.create(
+                    author=author, group=self.group, text='Ещё'
+                ),
+                author=author,
+                text=f'Комментарий {i}',
+            )
+        with CaptureQueriesContext(connection) as large:
+            self.changelist()
+        self.assertEqual(len(small), len(large))
+        with CaptureQueriesContext(connection) as comments:
+            self.changelist('comment')
+        self.assertLessEqual(len(comments), len(large))
+        for query in large.captured_queries + comments.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_pages_follow_cursor(self):
+        first = self.changelist().context['cl']
+        self.assertIsNotNone(first.next_url)
+        self.assertIsNone(first.previous_url)
+        second = self.client.get(
+            reverse('admin:posts_post_changelist') + first.next_url
+        ).context['cl']
+        self.assertEqual(len(second.result_list), 100)
+        self.assertFalse(
+            {post.pk for post in first.result_list}
+            & {post.pk for post in second.result_list}
+        )
+        self.assertGreater(
+            first.result_list[-1].pk, second.result_list[0].pk
+        )
+        self.assertIsNotNone(second.previous_url)
+
+    def test_explicit_ordering_uses_page_numbers(self):
+        cl = self.changelist(o='1').context['cl']
+        self.assertIsNone(cl.cursor_page)
+        self.assertEqual(len(cl.result_list), 100)
+
+    @override_settings(ADMIN_ACTION_CHUNK_SIZE=7)
+    def test_delete_runs_in_chunks(self):
+        pks = list(Post.objects.values_list('pk', flat=True)[:20])
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': 'delete_in_chunks', '_selected_action': pks},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Post.objects.filter(pk__in=pks).exists())
+        self.assertEqual(Post.objects.count(), 230)
+        form = self.changelist().context['action_form']
+        actions = [name for name, _ in form.fields['action'].choices]
+        self.assertNotIn('delete_selected', actions)
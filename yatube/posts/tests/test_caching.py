@@ -0,0 +1,110 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.db import transaction
+from django.test import (
+    RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+)
+
+from core import metrics
+from posts import caching
+from posts.caching import SITE, cache_by_generation
+
+
+@override_settings(FEED_CACHE_LOCK_WAIT=0.2)
+class CacheByGenerationTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.renders = 0
+
+        @cache_by_generation(lambda request: [(SITE,)])
+        def page(request):
+            self.renders += 1
+            return HttpResponse(f'render {self.renders}')
+
+        self.page = page
+
+    def get(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return self.page(request).content.decode()
+
+    def counters(self):
+        return {
+            name.split('.')[1]: value
+            for name, value in metrics.snapshot()['counters'].items()
+            if name.startswith('page_cache.')
+        }
+
+    def hold_lock(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        slot = caching.page_key(request, 'page', [])
+        cache.add(f'lock:{slot}', 1)
+
+    def test_hit_and_miss(self):
+        self.assertEqual(self.get(), 'render 1')
+        self.assertEqual(self.get(), 'render 1')
+        caching.bump(SITE)
+        self.assertEqual(self.get(), 'render 2')
+        self.assertEqual(self.counters(), {'miss': 2, 'hit': 1})
+
+    def test_stale_copy_is_served_during_rebuild(self):
+        self.get()
+        caching.bump(SITE)
+        self.hold_lock()
+        self.assertEqual(self.get(), 'render 1')
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(self.counters()['stale'], 1)
+
+    def test_waits_for_the_rebuilding_request(self):
+        self.hold_lock()
+
+        def finish(seconds):
+            # Пока мы ждём, блокировавший запрос успевает собрать страницу.
+            request = RequestFactory().get('/')
+            request.user = AnonymousUser()
+            caching.render(
+                lambda request: HttpResponse('built elsewhere'),
+                request, (), {}, caching.page_key(request, 'page', []),
+                caching.generations([(SITE,)]), '"etag"', None,
+            )
+
+        with mock.patch('posts.caching.time.sleep', side_effect=finish):
+            self.assertEqual(self.get(), 'built elsewhere')
+        self.assertEqual(self.renders, 0)
+        self.assertEqual(self.counters(), {'lock_wait': 1})
+
+    def test_renders_itself_when_wait_times_out(self):
+        self.hold_lock()
+        self.assertEqual(self.get(), 'render 1')
+        self.assertEqual(self.counters(), {'lock_wait': 1, 'lock_timeout': 1})
+
+    def test_early_refresh_near_expiry(self):
+        with override_settings(FEED_CACHE_TIMEOUT=1):
+            self.get()
+            with mock.patch('posts.caching.random.random', return_value=0.5):
+                self.assertFalse(caching.should_refresh({
+                    'expires': caching.time.time() + 1, 'delta': 0.01,
+                }))
+                self.assertTrue(caching.should_refresh({
+                    'expires': caching.time.time() + 1, 'delta': 10,
+                }))
+            with mock.patch('posts.caching.should_refresh',
+                            return_value=True):
+                self.assertEqual(self.get(), 'render 2')
+        self.assertEqual(self.counters()['early_refresh'], 1)
+
+
+class BumpOnCommitTest(TransactionTestCase):
+    def test_generation_moves_again_after_commit(self):
+        cache.clear()
+        key = caching.generation_key(SITE)
+        with transaction.atomic():
+            caching.bump(SITE)
+            # Страница, собранная до коммита по старым строкам.
+            rendered_under = cache.get(key)
+        self.assertNotEqual(cache.get(key), rendered_under)
@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts import counters
+from posts.models import Comment, Counter, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.group = Group.objects.create(
+            title='группа',
+            slug='counters',
+            description='описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='другая группа',
+            slug='other_counters',
+            description='описание'
+        )
+
+    def assertCounters(self):
+        for name, pk, expected in (
+            (counters.SITE_POSTS, None, Post.objects.count()),
+            (counters.AUTHOR_POSTS, self.author.pk,
+             self.author.posts.count()),
+            (counters.GROUP_POSTS, self.group.pk, self.group.posts.count()),
+            (counters.GROUP_POSTS, self.other_group.pk,
+             self.other_group.posts.count()),
+            (counters.FOLLOWERS, self.author.pk,
+             self.author.following.count()),
+            (counters.FOLLOWING, self.reader.pk,
+             self.reader.follower.count()),
+        ):
+            with self.subTest(name=name, pk=pk):
+                self.assertEqual(counters.get(name, pk), expected)
+
+    def test_counters_follow_writes(self):
+        self.assertCounters()
+        post = Post.objects.create(
+            author=self.author, text='пост', group=self.group
+        )
+        Post.objects.create(author=self.author, text='ещё пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters()
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters()
+        post.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertCounters()
+
+    def test_comment_counter_and_cascade(self):
+        post = Post.objects.create(author=self.author, text='пост')
+        Comment.objects.create(post=post, author=self.reader, text='раз')
+        Comment.objects.create(post=post, author=self.reader, text='два')
+        self.assertEqual(counters.get(counters.POST_COMMENTS, post.pk), 2)
+        post.delete()
+        self.assertFalse(Counter.objects.filter(
+            key=counters.make_key(counters.POST_COMMENTS, post.pk)
+        ).exists())
+
+    def test_reads_never_write(self):
+        Counter.objects.all().delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.get(counters.FOLLOWERS,
+                                          self.author.pk), 0)
+        self.assertFalse(Counter.objects.exists())
+
+    def test_change_creates_missing_row(self):
+        key = counters.make_key(counters.FOLLOWERS, self.author.pk)
+        Counter.objects.filter(key=key).delete()
+        counters.change(counters.FOLLOWERS, self.author.pk, 2)
+        counters.change(counters.FOLLOWERS, self.author.pk, -1)
+        self.assertEqual(Counter.objects.get(key=key).value, 1)
+
+    def test_bulk_created(self):
+        self.assertCounters()
+        posts = Post.objects.bulk_create(
+            Post(author=self.author, text=f'пост {i}', group=self.group)
+            for i in range(3)
+        )
+        counters.bulk_created(Post, posts)
+        self.assertCounters()
+
+    def test_rebuild_command(self):
+        Post.objects.create(author=self.author, text='пост', group=self.group)
+        Counter.objects.update(value=100)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounters()
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import feeds, following
+from posts.models import Follow
+
+User = get_user_model()
+
+
+class FollowingCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.authors = [
+            User.objects.create_user(f'author{i}') for i in range(4)
+        ]
+        for author in cls.authors[1:]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_set_is_cached_and_compact(self):
+        authors = following.followed(self.reader.pk)
+        self.assertEqual(
+            list(authors), sorted(author.pk for author in self.authors[1:])
+        )
+        self.assertEqual(
+            len(cache.get(following.cache_key(self.reader.pk))),
+            4 * len(authors),
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(following.is_following(
+                self.reader, self.authors[1].pk
+            ))
+            self.assertFalse(following.is_following(
+                self.reader, self.authors[0].pk
+            ))
+
+    def test_follow_and_unfollow_invalidate(self):
+        author = self.authors[0]
+        following.followed(self.reader.pk)
+        self.client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author.username}
+        ))
+        self.assertIn(author.pk, following.followed(self.reader.pk))
+        self.client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': author.username}
+        ))
+        self.assertNotIn(author.pk, following.followed(self.reader.pk))
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': author.username}
+        ))
+        self.assertFalse(response.context['following'])
+
+    @override_settings(FOLLOWING_CACHE_MAX=2)
+    def test_large_sets_fall_back_to_database(self):
+        self.assertIsNone(following.followed(self.reader.pk))
+        self.assertEqual(
+            cache.get(following.cache_key(self.reader.pk)), following.TOO_MANY
+        )
+        self.assertTrue(following.is_following(
+            self.reader, self.authors[2].pk
+        ))
+        self.assertEqual(
+            sorted(following.followed_among(
+                self.reader, [self.authors[0].pk, self.authors[3].pk]
+            )),
+            [self.authors[3].pk],
+        )
+
+    def test_pulled_authors_come_from_set(self):
+        following.followed(self.reader.pk)
+        cache.set(f'feeds:pulled:{settings.FEED_PULL_THRESHOLD}',
+                  [self.authors[0].pk, self.authors[2].pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                feeds.pulled_authors(self.reader), [self.authors[2].pk]
+            )
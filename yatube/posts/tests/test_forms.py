@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -67,6 +68,12 @@ class PostFormTest(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    @staticmethod
+    def image_name(content):
+        # Картинки называются по sha256 содержимого.
+        digest = hashlib.sha256(content).hexdigest()
+        return f'posts/{digest[:2]}/{digest}.gif'
+
     def setUp(self) -> None:
         cache.clear()
         self.authorized_client = Client()
@@ -99,7 +106,7 @@ class PostFormTest(TestCase):
                 author=self.user,
                 text='текст',
                 group=self.group,
-                image='posts/small.gif',
+                image=self.image_name(self.small_gif),
             ).exists()
         )
 
@@ -133,6 +140,39 @@ class PostFormTest(TestCase):
         self.assertTrue(post.group_id == test_data['group'])
         self.assertTrue(
             Post.objects.filter(
-                image='posts/small2.gif',
+                image=self.image_name(self.small_gif2),
             ).exists()
         )
+
+    @override_settings(POST_IMAGE_MAX_BYTES=20)
+    def test_oversized_image_is_rejected(self):
+        posts_count = Post.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'большая картинка',
+                'image': SimpleUploadedFile(
+                    name='big.gif',
+                    content=self.small_gif,
+                    content_type='image/gif'
+                ),
+            }
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertFormError(
+            response, 'form', 'image', 'Файл больше 20\xa0байт.'
+        )
+
+    def test_huge_dimensions_are_rejected_by_header(self):
+        # Заголовок GIF обещает 8000×2, пикселей в файле нет.
+        header = self.small_gif[:6] + b'\x40\x1f\x02\x00'
+        form = PostForm(
+            data={'text': 'бомба'},
+            files={'image': SimpleUploadedFile(
+                name='bomb.gif',
+                content=header + self.small_gif[10:],
+                content_type='image/gif'
+            )}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('8000×2', form.errors['image'][0])
@@ -0,0 +1,107 @@
+import re
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?posts_\w+( AS \w+)?$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+# Таблицы в несколько строк, которые читаются целиком намеренно.
+SMALL_TABLES = ('posts_pulledauthor',)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN')
+class QueryPlanTest(TestCase):
+    """Горячие запросы страниц идут по индексам, без полного прохода и
+    без сортировки во временном B-дереве."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.group = Group.objects.create(
+            title='группа',
+            slug='plans',
+            description='описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, text='пост', group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='ok')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, page, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(page, data)
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            if any(f'FROM "{table}"' in sql for table in SMALL_TABLES):
+                continue
+            for line in self.explain(sql):
+                with self.subTest(page=page, data=data, sql=sql, plan=line):
+                    self.assertIsNone(FULL_SCAN.search(line))
+                    self.assertIsNone(TEMP_SORT.search(line))
+        return response
+
+    def test_views_use_indexes(self):
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+        for page in pages:
+            self.assertIndexed(page)
+
+    def test_deep_pages_use_indexes(self):
+        """Страницы по курсору: цепочки OR по ключам (pub_date, id) и
+        (created, id) тоже идут по составным индексам."""
+        for i in range(12):
+            Post.objects.create(
+                author=self.author, text=f'пост {i}', group=self.group
+            )
+        for i in range(25):
+            Comment.objects.create(
+                post=self.post, author=self.reader, text=f'комментарий {i}'
+            )
+        feeds = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+        ]
+        for page in feeds:
+            cursor = self.client.get(page).context['page_obj'].next_cursor
+            self.assertIsNotNone(cursor)
+            self.assertIndexed(page, {'cursor': cursor})
+        detail = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        cursor = self.client.get(detail).context['comments_page'].next_cursor
+        self.assertIsNotNone(cursor)
+        self.assertIndexed(detail, {'comments': cursor})
+        self.assertIndexed(
+            reverse('posts:comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': cursor},
+        )
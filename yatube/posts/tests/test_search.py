@@ -0,0 +1,113 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post
+from posts.paginators import encode_cursor
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('user')
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.strong = Post.objects.create(
+            author=cls.user, text='Котики, котики и ещё раз котики'
+        )
+        cls.weak = Post.objects.create(
+            author=cls.user,
+            text='Длинный пост о погоде, где мельком упомянуты котики ' * 5
+        )
+        cls.other = Post.objects.create(author=cls.user, text='Про собак')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_search_ranks_by_bm25(self):
+        self.assertEqual(list(self.found('КОТИКИ')), [self.strong, self.weak])
+        self.assertEqual(list(self.found('кот')), [self.strong, self.weak])
+        self.assertEqual(list(self.found('')), [])
+        # Операторы FTS5 во вводе пользователя — просто слова.
+        self.assertEqual(list(self.found('котики OR NEAR(')), [])
+
+    @override_settings(SEARCH_MAX_CANDIDATES=1)
+    def test_only_freshest_matches_are_ranked(self):
+        self.assertEqual(list(self.found('котики')), [self.weak])
+
+    def test_index_follows_writes(self):
+        Post.objects.filter(pk=self.other.pk).update(text='Про котиков')
+        self.assertIn(self.other, self.found('котиков'))
+        Post.objects.get(pk=self.strong.pk).delete()
+        self.assertNotIn(self.strong, self.found('котики'))
+        Post.objects.bulk_create([Post(author=self.user, text='Котики')])
+        self.assertEqual(len(self.found('котики')), 2)
+
+    def test_search_is_paginated_by_cursor(self):
+        for i in range(12):
+            Post.objects.create(author=self.user, text=f'Лисы номер {i}')
+        first = self.found('лисы')
+        self.assertEqual(len(first), 10)
+        second = self.found('лисы', cursor=first.next_cursor)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        back = self.found('лисы', cursor=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_returns_first_page(self):
+        cursors = [
+            # Раньше уходили параметрами в сырой SQL и давали 500.
+            encode_cursor(([1], 1)),
+            encode_cursor(({'a': 1}, 1)),
+            encode_cursor((1.5, 2 ** 63)),
+            encode_cursor(('2020-01-01T00:00:00', 1)),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                page = self.found('котики', cursor=cursor)
+                self.assertEqual(list(page), [self.strong, self.weak])
+                self.assertFalse(page.has_previous())
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котики'}
+        )
+        self.assertEqual(
+            set(response.context['cl'].result_list), {self.strong, self.weak}
+        )
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) "
+                "VALUES ('delete-all')"
+            )
+        self.assertEqual(list(self.found('собак')), [])
+        call_command('rebuild_search', stdout=StringIO())
+        self.assertEqual(list(self.found('собак')), [self.other])
+
+    def test_plan_uses_fts_index(self):
+        where, params = search.match_condition('"котики"')
+        sql, params = Post.objects.extra(
+            where=[where], params=params
+        ).values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
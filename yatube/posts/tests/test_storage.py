@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.models import ImageLock, Post
+from posts.storage import is_content_name
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+def upload(name, content=SMALL_GIF):
+    return SimpleUploadedFile(name, content, content_type='image/gif')
+
+
+def run_on_commit(callback):
+    callback()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.user = User.objects.create_user('user')
+
+    def test_same_image_is_stored_once(self):
+        first = Post.objects.create(
+            author=self.user, text='раз', image=upload('meme.gif')
+        )
+        second = Post.objects.create(
+            author=self.user, text='два', image=upload('copy.gif')
+        )
+        other = Post.objects.create(
+            author=self.user, text='три', image=upload('other.gif', OTHER_GIF)
+        )
+        self.assertTrue(is_content_name(first.image.name))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1
+        )
+
+    @mock.patch('posts.thumbnails.transaction.on_commit', run_on_commit)
+    def test_file_is_deleted_with_last_reference(self):
+        first = Post.objects.create(
+            author=self.user, text='раз', image=upload('meme.gif')
+        )
+        second = Post.objects.create(
+            author=self.user, text='два', image=upload('meme.gif')
+        )
+        path = first.image.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageLock.objects.filter(name=first.image.name))
+
+    def test_upload_locks_the_name(self):
+        post = Post.objects.create(
+            author=self.user, text='раз', image=upload('meme.gif')
+        )
+        self.assertTrue(ImageLock.objects.filter(name=post.image.name))
+
+    def test_dedupe_command_merges_existing_files(self):
+        directory = os.path.join(TEMP_MEDIA_ROOT, 'posts')
+        os.makedirs(directory)
+        for name, content in (('a.gif', SMALL_GIF), ('b.gif', SMALL_GIF),
+                              ('c.gif', OTHER_GIF)):
+            with open(os.path.join(directory, name), 'wb') as image:
+                image.write(content)
+            post = Post.objects.create(author=self.user, text=name)
+            Post.objects.filter(pk=post.pk).update(image=f'posts/{name}')
+        out = StringIO()
+        call_command('dedupe_images', stdout=out)
+        names = dict(Post.objects.values_list('text', 'image'))
+        self.assertEqual(names['a.gif'], names['b.gif'])
+        self.assertNotEqual(names['a.gif'], names['c.gif'])
+        self.assertTrue(all(map(is_content_name, names.values())))
+        self.assertIn(f'({len(SMALL_GIF)} байт)', out.getvalue())
+        for name in set(names.values()):
+            self.assertTrue(
+                os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+            )
+
+    def test_dedupe_keeps_files_when_database_fails(self):
+        directory = os.path.join(TEMP_MEDIA_ROOT, 'posts')
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'a.gif'), 'wb') as image:
+            image.write(SMALL_GIF)
+        post = Post.objects.create(author=self.user, text='a.gif')
+        Post.objects.filter(pk=post.pk).update(image='posts/a.gif')
+        with mock.patch('django.db.models.query.QuerySet.update',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('dedupe_images', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/a.gif')
+        self.assertTrue(os.path.exists(post.image.path))
@@ -0,0 +1,127 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from posts import kvstore, thumbnails
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+def upload(name, content=SMALL_GIF):
+    return SimpleUploadedFile(name, content, content_type='image/gif')
+
+
+# Тесты с подменённым on_commit готовят миниатюры сразу, без пула.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailStoreTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        kvstore.lru.clear()
+        self.addCleanup(kvstore.lru.clear)
+        self.user = User.objects.create_user('user')
+        self.post = Post.objects.create(
+            author=self.user, text='пост', image=upload('lru.gif')
+        )
+        thumbnails.generate(self.post.image.name, self.user.pk, None)
+
+    def test_repeated_lookups_stay_in_process(self):
+        thumbnails.cached(self.post.image, 'card')
+        with mock.patch.object(
+            kvstore.KVStore, 'cache', new_callable=mock.PropertyMock
+        ) as shared:
+            with self.assertNumQueries(0):
+                for _ in range(10):
+                    self.assertIsNotNone(
+                        thumbnails.cached(self.post.image, 'card')
+                    )
+        shared.assert_not_called()
+
+    def test_lru_is_bounded_and_expires(self):
+        lru = kvstore.LRU(size=2, timeout=60)
+        for key in 'abc':
+            lru.set(key, key)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('a'))
+        with mock.patch('posts.kvstore.time.monotonic', return_value=1e12):
+            self.assertIsNone(lru.get('c'))
+
+    def test_failure_is_not_retried_until_timeout(self):
+        post = Post.objects.create(
+            author=self.user, text='пост', image=upload('broken.gif', b'gif?')
+        )
+        with mock.patch.object(
+            thumbnails.backend, 'get_thumbnail',
+            wraps=thumbnails.backend.get_thumbnail,
+        ) as get_thumbnail, self.assertLogs('posts.thumbnails', 'ERROR'):
+            for _ in range(3):
+                thumbnails.submit(post.image.name, self.user.pk, None)
+            self.assertEqual(get_thumbnail.call_count, 1)
+            cache.delete(thumbnails.failed_key(post.image.name))
+            thumbnails.submit(post.image.name, self.user.pk, None)
+            self.assertEqual(get_thumbnail.call_count, 2)
+
+    @mock.patch('posts.thumbnails.transaction.on_commit',
+                lambda callback: callback())
+    def test_image_change_drops_old_thumbnails(self):
+        old = self.post.image.name
+        self.assertIsNotNone(thumbnails.cached(self.post.image, 'card'))
+        self.post.image = upload('new.gif', OTHER_GIF)
+        self.post.save()
+        self.assertIsNone(thumbnails.backend.lookup(
+            thumbnails.source(old), '960x339', crop='center', upscale=True
+        ))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailPoolTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_pool_prepares_thumbnails_after_commit(self):
+        cache.clear()
+        kvstore.lru.clear()
+        self.addCleanup(kvstore.lru.clear)
+        user = User.objects.create_user('user')
+        post = Post.objects.create(
+            author=user, text='пост', image=upload('pool.gif')
+        )
+        # Без транзакции on_commit срабатывает сразу и отдаёт работу пулу.
+        thumbnails.schedule(post)
+        deadline = time.monotonic() + 10
+        while post.image.name in thumbnails._pending:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertIsNotNone(thumbnails._executor)
+        self.assertIsNotNone(thumbnails.backend.lookup(
+            thumbnails.source(post.image.name), '960x339',
+            crop='center', upscale=True,
+        ))
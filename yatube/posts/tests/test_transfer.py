@@ -0,0 +1,155 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from posts import counters, transfer
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.reader = User.objects.create_user('reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        for i in range(7):
+            post = Post.objects.create(
+                author=cls.author,
+                group=cls.group if i % 2 else None,
+                text=f'Пост {i}, "в кавычках",\nв две строки',
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'Комментарий {i}'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def snapshot(self):
+        return (
+            sorted(Post.objects.values_list(
+                'text', 'author__username', 'group__slug', 'pub_date',
+                'updated',
+            )),
+            sorted(Comment.objects.values_list(
+                'post__text', 'author__username', 'text', 'created'
+            )),
+            sorted(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        )
+
+    def clear(self):
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        User.objects.exclude(pk=self.author.pk).delete()
+        Group.objects.all().delete()
+
+    def roundtrip(self, fmt, **options):
+        before = self.snapshot()
+        call_command('export_yatube', self.directory, format=fmt,
+                     stdout=StringIO())
+        self.clear()
+        call_command('import_yatube', self.directory, format=fmt,
+                     stdout=StringIO(), **options)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_jsonl_roundtrip(self):
+        self.roundtrip('jsonl', chunk_size=3)
+        reader = User.objects.get(username='reader')
+        self.assertEqual(
+            counters.get(counters.POST_COMMENTS,
+                         Post.objects.earliest('pub_date').pk),
+            1,
+        )
+        self.assertEqual(reader.feed_entries.count(), 7)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, transfer.CHECKPOINT)
+        ))
+
+    def test_csv_roundtrip(self):
+        self.roundtrip('csv', chunk_size=2)
+        self.assertTrue(
+            User.objects.get(username='author').check_password('secret')
+        )
+
+    def test_existing_users_are_matched_by_username(self):
+        call_command('export_yatube', self.directory, stdout=StringIO())
+        Post.objects.all().delete()
+        call_command('import_yatube', self.directory, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(self.author.posts.count(), 7)
+
+    def test_resume_after_failure(self):
+        before = self.snapshot()
+        call_command('export_yatube', self.directory, stdout=StringIO())
+        self.clear()
+        bulk_create = Comment.objects.bulk_create
+        calls = []
+
+        def failing(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise ValueError('обрыв')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Comment.objects, 'bulk_create', failing):
+            with self.assertRaises(CommandError):
+                call_command('import_yatube', self.directory, chunk_size=2,
+                             stdout=StringIO())
+        with open(os.path.join(self.directory, transfer.CHECKPOINT)) as file:
+            state = json.load(file)
+        self.assertEqual(state['done'], {'posts': 7, 'comments': 2})
+        # Пачку, записанную до обрыва, повторная вставка пропустит.
+        state['done']['comments'] = 0
+        with open(os.path.join(self.directory, transfer.CHECKPOINT),
+                  'w') as file:
+            json.dump(state, file)
+        call_command('import_yatube', self.directory, chunk_size=2,
+                     stdout=StringIO())
+        self.assertEqual(self.snapshot(), before)
+
+    def test_id_range_is_reserved(self):
+        importer = transfer.Importer(self.directory)
+        importer.state = importer.load_state()
+        base = importer.base('posts', Post, 5)
+        post = Post.objects.create(author=self.author, text='параллельный')
+        self.assertGreater(post.pk, base + 5)
+
+    def test_foreign_rows_in_range_fail_loudly(self):
+        top = Post.objects.latest('pk').pk
+        rows = [
+            Post(id=pk, author=self.author, text='импорт')
+            for pk in range(top, top + 3)
+        ]
+        with self.assertRaises(ValueError):
+            transfer.unwritten(Post, rows)
+        self.assertEqual(transfer.unwritten(Post, rows[1:]), rows[1:])
+
+    def test_indexes_are_restored(self):
+        call_command('export_yatube', self.directory, stdout=StringIO())
+        self.clear()
+        call_command('import_yatube', self.directory, stdout=StringIO())
+        with connection.cursor() as cursor:
+            names = set(connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            ))
+        self.assertLessEqual(
+            {index.name for index in Post._meta.indexes}, names
+        )
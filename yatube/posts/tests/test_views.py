@@ -1,11 +1,22 @@
+import json
 import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from posts.models import Group, Post, Follow
+from posts import fragments, thumbnails
+from posts.models import Comment, Group, Post, Follow
+from posts.paginators import encode_cursor
 from django import forms
 from django.core.cache import cache
 User = get_user_model()
@@ -41,6 +52,7 @@ class PostsPagesTests(TestCase):
             group=cls.group,
             image=uploaded
         )
+        thumbnails.generate(cls.post.image.name, cls.user.pk, cls.group.pk)
         cls.another_group = Group.objects.create(
             title='заголовок группы',
             slug='group_slug',
@@ -177,14 +189,143 @@ class PostsPagesTests(TestCase):
 
     def test_index_cache(self):
         posts = self.authorized_client.get(reverse('posts:index')).content
+        # Запись в обход сигналов не меняет поколение — страница из кэша.
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        cached_posts = self.authorized_client.get(
+            reverse('posts:index')
+        ).content
+        self.assertEqual(posts, cached_posts)
         Post.objects.create(
             text='Новый пост',
             author=self.user
         )
-        cached_posts = self.authorized_client.get(
+        fresh_posts = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        self.assertEqual(posts, cached_posts)
+        self.assertIn('Новый пост'.encode(), fresh_posts)
+
+    def test_post_cards_are_cached_by_version(self):
+        with mock.patch(
+            'posts.fragments.render_to_string',
+            wraps=fragments.render_to_string
+        ) as render_card:
+            fragments.attach_cards([self.post])
+            fragments.attach_cards([Post.objects.get(pk=self.post.pk)])
+            self.assertEqual(render_card.call_count, 1)
+            self.post.text = 'Исправленный пост'
+            self.post.save()
+            edited = fragments.attach_cards([self.post])[0]
+            self.assertEqual(render_card.call_count, 2)
+        self.assertIn('Исправленный пост', edited.card)
+
+    def test_card_waits_for_thumbnail(self):
+        post = Post.objects.create(
+            author=self.user,
+            text='пост с новой картинкой',
+            image=SimpleUploadedFile(
+                name='new.gif',
+                # Другая палитра: та же картинка нашлась бы по содержимому.
+                content=self.post.image.open('rb').read().replace(
+                    b'\xFF\xFF\xFF', b'\x00\xFF\x00'
+                ),
+                content_type='image/gif'
+            )
+        )
+        card = fragments.attach_cards([post])[0].card
+        self.assertIn('Изображение готовится', card)
+        self.assertEqual(cache.get(fragments.card_key(
+            post, fragments.FEED_CARD
+        )), None)
+        thumbnails.generate(post.image.name, self.user.pk, None)
+        card = fragments.attach_cards([Post.objects.get(pk=post.pk)])[0].card
+        self.assertIn('<img', card)
+        self.assertNotIn('Изображение готовится', card)
+
+    def test_renamed_author_is_shown_everywhere(self):
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for page in pages:
+            self.authorized_client.get(page)
+        self.user.first_name, self.user.last_name = 'Новое', 'Имя'
+        self.user.save()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertIn(
+                    'Новое Имя'.encode(),
+                    self.authorized_client.get(page).content
+                )
+
+    def test_group_and_profile_cache_follow_writes(self):
+        pages = [
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for page in pages:
+            self.authorized_client.get(page)
+        Post.objects.create(
+            text='Свежий пост в группе',
+            author=self.user,
+            group=self.group
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertIn(
+                    'Свежий пост в группе'.encode(),
+                    self.authorized_client.get(page).content
+                )
+
+    def test_unchanged_pages_return_304(self):
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        for page in pages:
+            with self.subTest(page=page):
+                etag = self.authorized_client.get(page)['ETag']
+                response = self.authorized_client.get(
+                    page, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+                self.assertEqual(response['ETag'], etag)
+                self.assertIn('no-cache', response['Cache-Control'])
+                # У другого пользователя своя шапка и свой ETag.
+                self.assertEqual(self.client.get(
+                    page, HTTP_IF_NONE_MATCH=etag
+                ).status_code, 200)
+
+    def test_validators_change_after_comment(self):
+        pages = [
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        etags = [self.authorized_client.get(page)['ETag'] for page in pages]
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Свежий комментарий'
+        )
+        for page, etag in zip(pages, etags):
+            with self.subTest(page=page):
+                response = self.authorized_client.get(
+                    page, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_has_no_last_modified(self):
+        # ETag зависит ещё от поколений и пользователя, дата — нет:
+        # по одному If-Modified-Since 304 отдавать нельзя.
+        page = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertFalse(self.authorized_client.get(page).has_header(
+            'Last-Modified'
+        ))
+        self.assertEqual(self.client.get(
+            page, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        ).status_code, 200)
 
 
 class PaginatorViewsTest(TestCase):
@@ -223,6 +364,49 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(self.guest_client.get(
                     page + '?page=2').context.get('page_obj')), second_page)
 
+    def test_cursor_pagination(self):
+        first_page = self.guest_client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        self.assertFalse(first_page.has_previous())
+        second_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertEqual(
+            list(second_page),
+            list(Post.objects.order_by('-pub_date', '-id')[10:])
+        )
+        back_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_broken_cursor_returns_first_page(self):
+        now = timezone.now()
+        cursors = [
+            'не-курсор',
+            # id не влезает в 64 бита: раньше OverflowError и 500.
+            encode_cursor((now, 2 ** 63)),
+            encode_cursor((now, [1])),
+            encode_cursor(('не-дата', 1)),
+            encode_cursor((now,)),
+        ]
+        post = Post.objects.first()
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.guest_client.get(
+                    reverse('posts:index'), {'cursor': cursor}
+                )
+                self.assertEqual(len(response.context['page_obj']), 10)
+                self.assertFalse(response.context['page_obj'].has_previous())
+                response = self.guest_client.get(
+                    reverse('posts:comments', kwargs={'post_id': post.pk}),
+                    {'cursor': cursor},
+                )
+                self.assertEqual(response.status_code, 200)
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -285,3 +469,224 @@ class FollowTests(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(self.post, response_not_follow.context['page_obj'])
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.reader = User.objects.create_user('reader')
+        cls.group = Group.objects.create(
+            title='заголовок',
+            slug='queries_slug',
+            description='описание'
+        )
+        cls.post = Post.objects.create(
+            author=User.objects.create_user('first_author'),
+            text='первый пост',
+            group=cls.group
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def pages(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'first_author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def count_queries(self):
+        counts = {}
+        for page in self.pages():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(page)
+            counts[page] = len(context.captured_queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_page(self):
+        Follow.objects.create(user=self.reader, author=self.post.author)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='комментарий'
+        )
+        before = self.count_queries()
+        for i in range(12):
+            author = User.objects.create_user(f'author_{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(author=author, text=f'пост {i}',
+                                       group=self.group)
+            Post.objects.create(author=self.post.author, text=f'ещё {i}',
+                                group=self.group)
+            for commented in (self.post, post):
+                Comment.objects.create(
+                    post=commented, author=author, text=f'комментарий {i}'
+                )
+        self.assertEqual(self.count_queries(), before)
+
+
+class CommentPreviewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.group = Group.objects.create(
+            title='группа', slug='previews', description='описание'
+        )
+        cls.quiet = Post.objects.create(
+            author=cls.author, text='без комментариев', group=cls.group
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='обсуждаемый', group=cls.group
+        )
+        for i in range(5):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_show_count_and_latest_comments(self):
+        reader = User.objects.create_user('reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(reader)
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+        ]
+        for page in pages:
+            with self.subTest(page=page):
+                posts = {
+                    post.pk: post
+                    for post in self.client.get(page).context['page_obj']
+                }
+                post = posts[self.post.pk]
+                self.assertEqual(post.comment_count, 5)
+                self.assertEqual(
+                    [comment.text for comment in post.comment_previews],
+                    ['комментарий 4', 'комментарий 3', 'комментарий 2'],
+                )
+                self.assertEqual(
+                    post.comment_previews[0].author_username, 'author'
+                )
+                self.assertEqual(posts[self.quiet.pk].comment_count, 0)
+                self.assertEqual(posts[self.quiet.pk].comment_previews, [])
+
+    def test_previews_and_counts_take_two_queries(self):
+        posts = list(Post.objects.for_feed())
+        with self.assertNumQueries(2):
+            fragments.attach_comment_previews(posts)
+        with self.assertNumQueries(0):
+            fragments.attach_comment_previews([])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'progress handler')
+    def test_preview_cost_does_not_grow_with_comments(self):
+        def steps():
+            # Число шагов виртуальной машины SQLite на запрос превью.
+            counted = []
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(
+                lambda: counted.append(1), 1
+            )
+            try:
+                list(Comment.objects.latest_per_post([self.post.pk], 3))
+            finally:
+                connection.connection.set_progress_handler(None, 0)
+            return len(counted)
+
+        before = steps()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.author, text=f'ещё {i}')
+            for i in range(2000)
+        )
+        self.assertLess(steps(), before * 2)
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.post = Post.objects.create(author=cls.author, text='пост')
+        for i in range(45):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'комментарий {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_page_and_count(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'комментарий 44')
+        self.assertEqual(response.context['comment_count'], 45)
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+        page = response.context['comments_page']
+        second = self.client.get(url, {'comments': page.next_cursor})
+        self.assertEqual(
+            second.context['comments'][0].text, 'комментарий 24'
+        )
+
+    def test_fragment_pages_through_all_comments(self):
+        url = reverse('posts:comments', kwargs={'post_id': self.post.pk})
+        texts, next_url, counts = [], url + '?format=json', set()
+        while next_url:
+            with CaptureQueriesContext(connection) as context:
+                data = self.client.get(next_url).json()
+            counts.add(len(context.captured_queries))
+            for query in context.captured_queries:
+                self.assertNotIn('COUNT(', query['sql'])
+            self.assertEqual(data['count'], 45)
+            texts += [comment['text'] for comment in data['comments']]
+            next_url = data['next']
+        self.assertEqual(
+            texts, [f'комментарий {i}' for i in reversed(range(45))]
+        )
+        self.assertEqual(len(counts), 1)
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'includes/comment_list.html')
+        self.assertContains(response, 'data-fragment=')
+        self.assertNotContains(response, '<html')
+        self.assertEqual(self.client.get(reverse(
+            'posts:comments', kwargs={'post_id': 0}
+        )).status_code, 404)
+
+    def test_fragment_varies_on_accept(self):
+        url = reverse('posts:comments', kwargs={'post_id': self.post.pk})
+        for accept in ('text/html', 'application/json'):
+            with self.subTest(accept=accept):
+                response = self.client.get(url, HTTP_ACCEPT=accept)
+                self.assertIn('Accept', response['Vary'])
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_benchmark_reports_every_route(self):
+        cache.set('чужой-ключ', 'значение')
+        output = tempfile.NamedTemporaryFile(suffix='.json')
+        call_command(
+            'benchmark_routes', current_db=True, users=5, groups=2, posts=30,
+            comments=20, follows=10, requests=2, output=output.name,
+            stdout=StringIO()
+        )
+        with open(output.name) as result:
+            routes = json.load(result)['routes']
+        self.assertEqual(set(routes), {
+            'index', 'group_list', 'profile', 'post_detail', 'follow_index',
+            'post_create', 'add_comment', 'follow_unfollow',
+        })
+        for name, route in routes.items():
+            with self.subTest(route=name):
+                self.assertLessEqual(route['p50_ms'], route['p99_ms'])
+                self.assertTrue(set(route['statuses']) <= {200, 302})
+        # Прогон не трогает общий кэш.
+        self.assertEqual(cache.get('чужой-ключ'), 'значение')
@@ -0,0 +1,175 @@
+"""Подготовка миниатюр в фоне.
+
+sorl создаёт миниатюру при первом показе, и первый зритель новой
+картинки ждёт, пока Pillow её декодирует и ужмёт. Здесь миниатюры всех
+размеров из POST_THUMBNAILS готовятся пулом потоков сразу после
+сохранения поста, а шаблоны только смотрят, готова ли миниатюра, и
+до тех пор показывают заглушку. Неудача запоминается в кэше на
+THUMBNAIL_RETRY_TIMEOUT, и до тех пор картинку снова не берут в работу.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class LookupBackend(ThumbnailBackend):
+    def lookup(self, file_, geometry_string, **options):
+        """То же, что get_thumbnail, но без генерации: None, если нет."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = LookupBackend()
+
+
+def geometry(name):
+    geometry_string, options = settings.POST_THUMBNAILS[name]
+    return geometry_string, dict(options)
+
+
+def source(image_name):
+    """Картинка поста по имени — с тем же хранилищем, что у поля, иначе
+    у sorl получатся другие ключи."""
+    from .models import Post
+
+    return ImageFile(image_name, Post._meta.get_field('image').storage)
+
+
+def cached(image, name):
+    """Готовая миниатюра или None; отсутствующую ставит в очередь."""
+    if not image:
+        return None
+    geometry_string, options = geometry(name)
+    thumbnail = backend.lookup(image, geometry_string, **options)
+    if thumbnail is None:
+        metrics.incr('thumbnails.pending')
+        schedule(image.instance)
+    return thumbnail
+
+
+def failed_key(image_name):
+    return f'thumbnails:failed:{image_name}'
+
+
+def generate(image_name, author_id, group_id):
+    """Готовит все миниатюры картинки и сбрасывает кэш её страниц."""
+    from .signals import bump_pages
+
+    try:
+        for name in settings.POST_THUMBNAILS:
+            geometry_string, options = geometry(name)
+            image = source(image_name)
+            backend.get_thumbnail(image, geometry_string, **options)
+            # Нечитаемую картинку sorl только пишет в лог и возвращает
+            # несохранённую миниатюру.
+            if backend.lookup(image, geometry_string, **options) is None:
+                raise ValueError(f'Миниатюра {name} не сохранена')
+        metrics.incr('thumbnails.generated')
+        # Страницы со заглушкой закэшированы — пусть соберутся заново.
+        bump_pages([author_id], [group_id] if group_id else [])
+    except Exception:
+        metrics.incr('thumbnails.failed')
+        logger.exception('Не удалось подготовить миниатюры %s', image_name)
+        cache.set(
+            failed_key(image_name), True, settings.THUMBNAIL_RETRY_TIMEOUT
+        )
+    finally:
+        with _lock:
+            _pending.discard(image_name)
+
+
+def _work(*args):
+    try:
+        generate(*args)
+    finally:
+        # У потока пула свои соединения с БД, закрываем их сами.
+        connections.close_all()
+
+
+def forget(image_name):
+    """Забывает миниатюры картинки, которую заменили или удалили."""
+    default.kvstore.delete(source(image_name))
+
+
+def release(image_name):
+    """Удаляет картинку и её миниатюры, если на неё больше нет ссылок.
+
+    Файлы общие для постов с одинаковой картинкой, поэтому решение
+    принимается после коммита, по текущему числу ссылок в БД, под
+    блокировкой имени: параллельная загрузка того же файла либо уже
+    закоммичена и видна, либо дождётся уборки и запишет файл заново.
+    """
+    def collect():
+        from .models import ImageLock, Post
+        from .storage import lock_name
+
+        # Уборка после коммита не должна ронять запрос.
+        try:
+            with transaction.atomic():
+                lock_name(image_name)
+                if Post.objects.filter(image=image_name).exists():
+                    return
+                forget(image_name)
+                source(image_name).delete()
+                ImageLock.objects.filter(name=image_name).delete()
+        except Exception:
+            logger.exception('Не удалось удалить картинку %s', image_name)
+            return
+        metrics.incr('images.released')
+
+    transaction.on_commit(collect)
+
+
+def submit(image_name, author_id, group_id):
+    global _executor
+    if cache.get(failed_key(image_name)):
+        metrics.incr('thumbnails.skipped_failed')
+        return
+    with _lock:
+        if image_name in _pending:
+            return
+        _pending.add(image_name)
+        if settings.THUMBNAIL_WORKERS and _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    if settings.THUMBNAIL_WORKERS:
+        _executor.submit(_work, image_name, author_id, group_id)
+    else:
+        generate(image_name, author_id, group_id)
+
+
+def schedule(post):
+    """Ставит миниатюры поста в очередь после коммита транзакции."""
+    if not post.image:
+        return
+    # Аргументы фиксируем сейчас: пост может поменяться до коммита.
+    args = (post.image.name, post.author_id, post.group_id)
+    transaction.on_commit(lambda: submit(*args))
@@ -0,0 +1,415 @@
+"""Потоковая выгрузка и загрузка пользователей, групп, постов,
+комментариев и подписок.
+
+Выгрузка — по файлу на вид данных (JSONL или CSV) в каталоге, строки
+идут по возрастанию id и читаются из базы через iterator(), так что
+память не зависит от размера базы. Все виды читаются из одного снимка:
+комментарий или подписка, записанные на живом сайте посреди выгрузки,
+иначе ссылались бы на пост или пользователя, которых в файлах нет.
+
+Загрузка пишет пачками через bulk_create, каждая пачка — своя
+транзакция. Пользователи и группы сопоставляются по username и slug,
+остальное получает новые id подряд от сохранённой в контрольной точке
+базы: новый id поста — база плюс номер строки в файле, поэтому
+соответствие старых id новым восстанавливается по одному файлу без
+запросов. Диапазон id за базой резервируется в последовательности
+таблицы и проверяется на пустоту; если в него всё же попала чужая
+строка, загрузка падает, а не теряет строки молча. Контрольная точка
+хранит базы и число загруженных строк; после обрыва загрузка
+продолжается с первой незаписанной пачки, а пачку, записанную перед
+самым обрывом, узнаёт по id и пропускает.
+Вторичные индексы на время загрузки снимаются и строятся в конце.
+"""
+import csv
+import itertools
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from core import db
+
+from .models import Comment, Follow, Group, Post
+from .seeding import explicit_dates
+
+User = get_user_model()
+
+FORMATS = ('jsonl', 'csv')
+CHECKPOINT = 'import-checkpoint.json'
+DATES = {'date_joined', 'pub_date', 'updated', 'created'}
+
+KINDS = (
+    ('users', User, ('id', 'username', 'first_name', 'last_name',
+                     'email', 'password', 'date_joined')),
+    ('groups', Group, ('id', 'title', 'slug', 'description')),
+    ('posts', Post, ('id', 'author_id', 'group_id', 'text', 'pub_date',
+                     'updated', 'image')),
+    ('comments', Comment, ('id', 'post_id', 'author_id', 'text',
+                           'created')),
+    ('follows', Follow, ('user_id', 'author_id')),
+)
+# Индексы, без которых вставка идёт заметно быстрее.
+DEFERRED_INDEXES = (Post, Comment, Follow)
+
+
+def path(directory, kind, fmt):
+    return os.path.join(directory, f'{kind}.{fmt}')
+
+
+def encode(value, fmt):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None and fmt == 'csv':
+        return ''
+    return value
+
+
+def decode(record):
+    """Значения строки файла в типы полей модели."""
+    for key, value in record.items():
+        if value in ('', None) and (key.endswith('_id') or key in DATES):
+            record[key] = None
+        elif key == 'id' or key.endswith('_id'):
+            record[key] = int(value)
+        elif key in DATES:
+            record[key] = parse_datetime(value)
+    return record
+
+
+def export(directory, fmt='jsonl', chunk_size=2000, log=None):
+    """Выгружает все виды данных в каталог; возвращает число строк."""
+    log = log or (lambda message: None)
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    with db.read_snapshot():
+        for kind, model, fields in KINDS:
+            rows = model.objects.order_by('pk').values_list(*fields).iterator(
+                chunk_size=chunk_size
+            )
+            total = 0
+            with open(path(directory, kind, fmt), 'w', newline='',
+                      encoding='utf-8') as file:
+                if fmt == 'csv':
+                    writer = csv.writer(file)
+                    writer.writerow(fields)
+                for row in rows:
+                    values = [encode(value, fmt) for value in row]
+                    if fmt == 'csv':
+                        writer.writerow(values)
+                    else:
+                        file.write(json.dumps(
+                            dict(zip(fields, values)), ensure_ascii=False
+                        ) + '\n')
+                    total += 1
+                    if total % chunk_size == 0:
+                        log(f'{kind}: {total}')
+            counts[kind] = total
+            log(f'{kind}: {total}')
+    return counts
+
+
+def read(directory, kind, fmt):
+    with open(path(directory, kind, fmt), newline='',
+              encoding='utf-8') as file:
+        if fmt == 'csv':
+            for record in csv.DictReader(file):
+                yield decode(record)
+        else:
+            for line in file:
+                if line.strip():
+                    yield decode(json.loads(line))
+
+
+def batches(records, size):
+    while True:
+        batch = list(itertools.islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+class SequentialIds:
+    """Старые id по возрастанию -> новые id подряд от базы.
+
+    Массив вместо словаря: восемь байт на строку, поиск — бинарный.
+    """
+
+    def __init__(self, ids, base):
+        self.ids = ids
+        self.base = base
+
+    def __getitem__(self, source_id):
+        index = bisect_left(self.ids, source_id)
+        if index == len(self.ids) or self.ids[index] != source_id:
+            raise KeyError(source_id)
+        return self.base + index + 1
+
+
+def index_names(model):
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        ))
+
+
+@contextmanager
+def deferred_indexes(models):
+    """Снимает индексы из Meta.indexes и строит их заново в конце,
+    даже если загрузка прервалась. Без schema_editor(): тот на SQLite
+    нельзя открыть внутри транзакции."""
+    editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model in models:
+            existing = index_names(model)
+            for index in model._meta.indexes:
+                if index.name in existing:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for model in models:
+                existing = index_names(model)
+                for index in model._meta.indexes:
+                    if index.name not in existing:
+                        cursor.execute(str(index.create_sql(model, editor)))
+
+
+class Importer:
+    def __init__(self, directory, fmt='jsonl', chunk_size=2000, log=None):
+        self.directory = directory
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        self.checkpoint = os.path.join(directory, CHECKPOINT)
+        self.written = 0
+        self.author_ids = set()
+        self.group_ids = set()
+        if fmt == 'csv':
+            # Тексты постов бывают длиннее стандартного предела CSV.
+            csv.field_size_limit(sys.maxsize)
+
+    def load_state(self):
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as file:
+                state = json.load(file)
+            if state['format'] != self.fmt:
+                raise ValueError(
+                    f'Начатая загрузка шла из формата {state["format"]}'
+                )
+            return state
+        return {'format': self.fmt, 'bases': {}, 'done': {}}
+
+    def save_state(self):
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.checkpoint)
+
+    def run(self, defer_indexes=True):
+        self.state = self.load_state()
+        self.save_state()
+        users = self.import_natural('users', User, 'username')
+        groups = self.import_natural('groups', Group, 'slug')
+        indexes = (
+            deferred_indexes(DEFERRED_INDEXES) if defer_indexes
+            else nullcontext()
+        )
+        with explicit_dates(), indexes:
+            posts = self.import_posts(users, groups)
+            self.import_comments(users, posts)
+            self.import_follows(users)
+        reset_sequences()
+        os.remove(self.checkpoint)
+
+    def import_natural(self, kind, model, key):
+        """Сопоставляет строки с уже существующими по естественному
+        ключу и создаёт недостающие. Повторный проход ничего не меняет,
+        поэтому контрольная точка здесь не нужна."""
+        ids = {}
+        for batch in batches(read(self.directory, kind, self.fmt),
+                             self.chunk_size):
+            keys = [record[key] for record in batch]
+            with transaction.atomic():
+                existing = set(model.objects.filter(
+                    **{f'{key}__in': keys}
+                ).values_list(key, flat=True))
+                model.objects.bulk_create(
+                    model(**{
+                        name: value for name, value in record.items()
+                        if name != 'id'
+                    })
+                    for record in batch if record[key] not in existing
+                )
+                pks = dict(model.objects.filter(
+                    **{f'{key}__in': keys}
+                ).values_list(key, 'pk'))
+            for record in batch:
+                ids[record['id']] = pks[record[key]]
+            self.written += len(batch) - len(existing)
+            self.log(f'{kind}: {len(ids)}')
+        return ids
+
+    def base(self, kind, model, count):
+        """Начало диапазона id для count строк; при первом вызове
+        диапазон резервируется и проверяется на пустоту."""
+        bases = self.state['bases']
+        if kind not in bases:
+            base = model.objects.aggregate(top=Max('pk'))['top'] or 0
+            reserve_ids(model, base + count)
+            if model.objects.filter(pk__gt=base).exists():
+                raise ValueError(
+                    f'{kind}: id после {base} заняли во время загрузки'
+                )
+            bases[kind] = base
+            self.save_state()
+        return bases[kind]
+
+    def import_rows(self, kind, model, build, pending=None):
+        """Пишет строки пачками начиная с первой незаписанной.
+
+        Пачка могла закоммититься прямо перед обрывом, не успев попасть
+        в контрольную точку: pending(model, rows) по id отличает её и
+        возвращает только незаписанные строки. Любой другой конфликт —
+        ошибка, а не пропущенные строки.
+        """
+        pending = pending or unwritten
+        done = self.state['done'].get(kind, 0)
+        records = itertools.islice(
+            read(self.directory, kind, self.fmt), done, None
+        )
+        for batch in batches(records, self.chunk_size):
+            rows = [
+                build(number, record)
+                for number, record in enumerate(batch, done)
+            ]
+            with transaction.atomic():
+                model.objects.bulk_create(pending(model, rows))
+            done += len(batch)
+            self.written += len(batch)
+            self.state['done'][kind] = done
+            self.save_state()
+            self.log(f'{kind}: {done}')
+
+    def import_posts(self, users, groups):
+        ids = array('q')
+        for record in read(self.directory, 'posts', self.fmt):
+            if ids and record['id'] <= ids[-1]:
+                raise ValueError('Посты в файле не по возрастанию id')
+            ids.append(record['id'])
+        base = self.base('posts', Post, len(ids))
+
+        def build(number, record):
+            author_id = users[record['author_id']]
+            group_id = record['group_id'] and groups[record['group_id']]
+            self.author_ids.add(author_id)
+            self.group_ids.add(group_id)
+            return Post(
+                id=base + number + 1,
+                author_id=author_id,
+                group_id=group_id,
+                text=record['text'],
+                pub_date=record['pub_date'],
+                updated=record['updated'],
+                image=record['image'],
+            )
+        self.import_rows('posts', Post, build)
+        return SequentialIds(ids, base)
+
+    def import_comments(self, users, posts):
+        base = self.base('comments', Comment, sum(
+            1 for record in read(self.directory, 'comments', self.fmt)
+        ))
+
+        def build(number, record):
+            return Comment(
+                id=base + number + 1,
+                post_id=posts[record['post_id']],
+                author_id=users[record['author_id']],
+                text=record['text'],
+                created=record['created'],
+            )
+        self.import_rows('comments', Comment, build)
+
+    def import_follows(self, users):
+        def build(number, record):
+            return Follow(
+                user_id=users[record['user_id']],
+                author_id=users[record['author_id']],
+            )
+        self.import_rows('follows', Follow, build, new_follows)
+
+
+def unwritten(model, rows):
+    """Пачка с явными id подряд: пустой список, если она уже в базе
+    целиком, и ошибка, если её id заняты частично."""
+    present = model.objects.filter(
+        pk__range=(rows[0].pk, rows[-1].pk)
+    ).count()
+    if present == len(rows):
+        return []
+    if present:
+        raise ValueError(
+            f'{model._meta.label}: id {rows[0].pk}–{rows[-1].pk} '
+            'частично заняты чужими строками'
+        )
+    return rows
+
+
+def new_follows(model, rows):
+    """Подписки без id совпадают с существующими по паре
+    (user, author), как пользователи — по username."""
+    existing = set(model.objects.filter(
+        user_id__in={row.user_id for row in rows}
+    ).values_list('user_id', 'author_id'))
+    return [
+        row for row in rows if (row.user_id, row.author_id) not in existing
+    ]
+
+
+def reserve_ids(model, top):
+    """Сдвигает последовательность id таблицы не ниже top, чтобы
+    параллельные вставки не получали id из диапазона загрузки."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT: следующий id больше и max(id), и seq.
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = MAX(seq, %s)'
+                ' WHERE name = %s', (top, table)
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    (table, top),
+                )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'),"
+                " GREATEST(%s, nextval(pg_get_serial_sequence(%s, 'id'))))",
+                (table, top, table),
+            )
+        else:
+            raise ValueError(
+                f'Резервировать id на {connection.vendor} не умеем'
+            )
+
+
+def reset_sequences():
+    """После вставки явных id последовательности (PostgreSQL) должны
+    продолжаться за ними; SQLite следит за этим сам."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [Post, Comment, Follow]
+    )
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -0,0 +1,67 @@
+"""Приём картинок постов с ограниченным расходом памяти.
+
+Загрузка всегда пишется во временный файл, а не в память, и перестаёт
+писаться, как только превышен POST_IMAGE_MAX_BYTES. Размеры картинки
+проверяются по заголовку, без декодирования пикселей, до того как
+Pillow возьмётся проверять файл целиком.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, но не больше лимита."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.exceeded = (
+            self.content_length is not None
+            and self.content_length > settings.POST_IMAGE_MAX_BYTES
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.exceeded:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            # Остаток тела дочитывается парсером, но уже никуда не пишется.
+            self.exceeded = True
+            self.file.truncate(0)
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.exceeded = self.exceeded
+        return upload
+
+
+def image_error(upload):
+    """Почему картинку нельзя принять, или None, если можно.
+
+    Что файл вообще не картинка, здесь не решается: это скажет
+    forms.ImageField.
+    """
+    limit = settings.POST_IMAGE_MAX_BYTES
+    if getattr(upload, 'exceeded', False) or upload.size > limit:
+        return f'Файл больше {filesizeformat(limit)}.'
+    try:
+        # Image.open читает только заголовок, пиксели не декодируются.
+        with Image.open(upload) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        return 'Картинка слишком большая.'
+    except Exception:
+        return None
+    finally:
+        upload.seek(0)
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if max(width, height) > max_side:
+        return (f'Картинка {width}×{height}: стороны должны быть '
+                f'не больше {max_side} пикселей.')
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        return f'Картинка {width}×{height} слишком большая.'
+    return None
@@ -1,66 +1,202 @@
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import redirect, render, get_object_or_404
-from .models import Post, Group, User, Follow
-from django.core.paginator import Paginator
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from .models import Comment, Post, Group, User, Follow
 from django.contrib.auth.decorators import login_required
 from .forms import PostForm, CommentForm
-from django.views.decorators.cache import cache_page
+from . import counters, following, thumbnails
+from .feeds import FeedPaginator
+from .fragments import (
+    FEED_CARD, PROFILE_CARD, attach_cards, attach_comment_previews
+)
+from .paginators import CountedPaginator, CursorPaginator
+from .search import SearchPaginator
+from .caching import (
+    AUTHOR, GROUP, SITE, cache_by_generation, conditional, generations,
+    key_etag, page_key
+)
+
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
 
 
-def pagination(posts, request):
-    paginator = Paginator(posts, 10)
+def pagination(posts, request, counter=None, card=FEED_CARD):
+    if counter is None:
+        paginator = CursorPaginator(posts, POSTS_PER_PAGE)
+    else:
+        paginator = CountedPaginator(posts, POSTS_PER_PAGE, counter)
+    return get_page(paginator, request, card)
+
+
+def get_page(paginator, request, card=FEED_CARD):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if page_number is not None:
+        # Старые ссылки вида ?page=N продолжают работать через OFFSET.
+        page_obj = paginator.get_page(page_number)
+    else:
+        page_obj = paginator.get_cursor_page(request.GET.get('cursor'))
+    attach_cards(page_obj, card)
+    attach_comment_previews(page_obj)
     return {
         'page_obj': page_obj,
     }
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_by_generation(lambda request: [(SITE,)])
 def index(request):
-    context = pagination(Post.objects.all().select_related('author'), request)
+    context = pagination(
+        Post.objects.for_feed(),
+        request,
+        counter=(counters.SITE_POSTS,)
+    )
     return render(request, 'posts/index.html', context)
 
 
+@cache_by_generation(lambda request, slug: [(GROUP, slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.for_feed()
     context = {
         'group': group,
         'posts': posts,
     }
-    context.update(pagination(group.posts.all(), request))
+    context.update(pagination(
+        posts, request, counter=(counters.GROUP_POSTS, group.pk)
+    ))
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_by_generation(lambda request, username: [(AUTHOR, username)])
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
     context = {
         'author': author,
-        'following': following,
+        'following': following.is_following(request.user, author.pk),
+        'post_count': counters.get(counters.AUTHOR_POSTS, author.pk),
+        'follower_count': counters.get(counters.FOLLOWERS, author.pk),
     }
-    context.update(pagination(author.posts.all(), request))
+    context.update(pagination(
+        author.posts.for_feed(),
+        request,
+        counter=(counters.AUTHOR_POSTS, author.pk),
+        card=PROFILE_CARD
+    ))
     return render(request, 'posts/profile.html', context)
 
 
+def post_version(request, post_id):
+    """Одним запросом всё, от чего зависит страница поста, кроме
+    поколений: правка поста, автор и группа."""
+    if not hasattr(request, 'post_version'):
+        request.post_version = Post.objects.filter(pk=post_id).values_list(
+            'updated', 'author__username', 'group__slug'
+        ).first()
+    return request.post_version
+
+
+def post_etag(request, post_id):
+    version = post_version(request, post_id)
+    if version is None:
+        return None
+    updated, username, slug = version
+    # Комментарии, счётчик постов автора и готовность миниатюры
+    # сдвигают поколение автора, название группы — поколение группы.
+    scopes = [(AUTHOR, username)]
+    if slug is not None:
+        scopes.append((GROUP, slug))
+    return key_etag(page_key(request, 'post_detail', [
+        updated.timestamp(), *generations(scopes)
+    ]))
+
+
+@conditional(post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.for_feed(), pk=post_id)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
-    post_count = post.author.posts.count()
+    # ?comments=<курсор> — следующая страница комментариев без JS.
+    comments_page = comment_page(post.pk, request.GET.get('comments'))
+    post_count = counters.get(counters.AUTHOR_POSTS, post.author_id)
     image = post.image
     context = {
         'form': form,
         'post_count': post_count,
         'post': post,
-        'comments': comments,
+        'comments': comments_page.object_list,
+        'comments_page': comments_page,
+        'comment_count': comments_page.paginator.count,
         'image': image,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_page(post_id, cursor=None):
+    """Страница комментариев поста по курсору (created, id); их число
+    берётся из счётчика."""
+    paginator = CountedPaginator(
+        Comment.objects.filter(post_id=post_id).for_thread(),
+        COMMENTS_PER_PAGE,
+        (counters.POST_COMMENTS, post_id),
+        keys=('created', 'id'),
+    )
+    return paginator.get_cursor_page(cursor)
+
+
+def post_comments(request, post_id):
+    """Следующая страница комментариев для подгрузки: HTML-фрагмент или
+    JSON, если его просят через ?format=json или Accept."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    page = comment_page(post.pk, request.GET.get('cursor'))
+    if (request.GET.get('format') == 'json'
+            or 'application/json' in request.META.get('HTTP_ACCEPT', '')):
+        next_url = None
+        if page.has_next():
+            next_url = (
+                reverse('posts:comments', kwargs={'post_id': post.pk})
+                + '?' + urlencode({'cursor': page.next_cursor,
+                                   'format': 'json'})
+            )
+        response = JsonResponse({
+            'count': page.paginator.count,
+            'next': next_url,
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in page
+            ],
+        })
+    else:
+        response = render(request, 'includes/comment_list.html', {
+            'post': post,
+            'comments_page': page,
+        })
+    # Формат зависит от Accept: кэши не должны отдавать JSON фрагменту.
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, POSTS_PER_PAGE)
+    page_obj = paginator.get_cursor_page(request.GET.get('cursor'))
+    attach_cards(page_obj, FEED_CARD)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        # Курсорные ссылки паджинатора не должны терять запрос.
+        'page_query': urlencode({'q': query}),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -69,7 +205,11 @@ def post_create(request):
         return render(request, 'posts/post_create.html', context)
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    # Запись вместе с сигналами (счётчики, ленты, блокировка картинки)
+    # — одна транзакция.
+    with transaction.atomic():
+        post.save()
+        thumbnails.schedule(post)
     return redirect('posts:profile', post.author)
 
 
@@ -90,7 +230,10 @@ def post_edit(request, post_id):
             'post_id': post_id,
             'is_edit': True
         })
-    form.save()
+    with transaction.atomic():
+        form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -102,14 +245,14 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    context = pagination(posts, request)
+    context = get_page(FeedPaginator(request.user, POSTS_PER_PAGE), request)
     return render(request, 'posts/follow.html', context)
 
 
@@ -117,15 +260,17 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(
-            author=author,
-            user=request.user
-        )
+        with transaction.atomic():
+            Follow.objects.get_or_create(
+                author=author,
+                user=request.user
+            )
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(author=author, user=request.user).delete()
+    with transaction.atomic():
+        Follow.objects.filter(author=author, user=request.user).delete()
     return redirect('posts:profile', username=username)
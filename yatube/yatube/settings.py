@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from core.db import database_settings, sqlite_pragmas
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -47,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,12 +86,12 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# База задаётся переменными окружения, по умолчанию — SQLite в режиме
+# WAL с постоянными соединениями, см. core/db.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': database_settings(BASE_DIR),
 }
+SQLITE_PRAGMAS = sqlite_pragmas()
 
 
 # Password validation
@@ -154,12 +157,96 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Кэш общий для всех воркеров: файл SQLite рядом с базой, см.
+# core/cache.py. Тесты держат его во временном каталоге, см.
+# yatube/settings_test.py.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Материализованные ленты подписок: сколько записей хранить на
+# пользователя, размер пачки при раскладке и как часто обрезать ленту.
+FEED_MAX_ENTRIES = 1000
+FEED_BATCH_SIZE = 1000
+FEED_TRIM_EVERY = 20
+# Авторы с таким числом подписчиков читаются в ленту на лету.
+FEED_PULL_THRESHOLD = 10000
+FEED_PULLED_CACHE_TIMEOUT = 60
+# Множество авторов, на которых подписан пользователь, см.
+# posts/following.py: не больше стольких id на пользователя.
+FOLLOWING_CACHE_MAX = 50000
+FOLLOWING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Страницы лент кэшируются до смены поколения, см. posts/caching.py.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Сколько ещё хранить копию после истечения, чтобы отдавать её, пока
+# один запрос собирает новую; сколько держится блокировка сборки и
+# сколько ждать, если прежней копии нет.
+FEED_CACHE_STALE = 60 * 10
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_LOCK_WAIT = 2
+# Карточки постов кэшируются по (id, updated), см. posts/fragments.py.
+POST_CARD_TIMEOUT = 60 * 60 * 24
+# Сколько последних комментариев показывать под карточкой в лентах.
+COMMENT_PREVIEWS = 3
+
+# Загрузки пишутся во временный файл с жёстким лимитом размера,
+# размеры картинки проверяются по заголовку, см. posts/uploads.py.
+FILE_UPLOAD_HANDLERS = ['posts.uploads.CappedUploadHandler']
+POST_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+POST_IMAGE_MAX_SIDE = 6000
+POST_IMAGE_MAX_PIXELS = 24 * 1000 * 1000
+
+# Миниатюры картинок постов по именам, как их зовут шаблоны. Они
+# готовятся в фоне после загрузки, см. posts/thumbnails.py.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Число потоков подготовки миниатюр; 0 — готовить сразу после коммита.
+THUMBNAIL_WORKERS = 2
+# Сколько секунд не браться снова за картинку, миниатюры которой
+# подготовить не удалось: битый файл иначе уходил бы в пул на каждый показ.
+THUMBNAIL_RETRY_TIMEOUT = 600
+# Перед хранилищем ключей sorl стоит LRU в памяти процесса,
+# см. posts/kvstore.py.
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE = 10000
+THUMBNAIL_LRU_TIMEOUT = 300
+
+# Поиск ранжирует по bm25 не больше стольких самых свежих совпадений,
+# см. posts/search.py.
+SEARCH_MAX_CANDIDATES = 5000
+
+# Списки админки для больших таблиц, см. posts/changelist.py: точный
+# подсчёт с фильтром останавливается на ADMIN_COUNT_CAP, действия над
+# выбранным идут транзакциями по ADMIN_ACTION_CHUNK_SIZE объектов.
+ADMIN_COUNT_CAP = 10000
+ADMIN_ACTION_CHUNK_SIZE = 500
+
+# Бюджеты запросов к БД на один запрос по имени маршрута,
+# см. core/middleware.py.
+QUERY_BUDGET_DEFAULT = {'queries': 20, 'ms': 200}
+QUERY_BUDGETS = {
+    'posts:index': {'queries': 8, 'ms': 50},
+    'posts:group_list': {'queries': 8, 'ms': 50},
+    'posts:profile': {'queries': 10, 'ms': 50},
+    'posts:post_detail': {'queries': 10, 'ms': 50},
+    'posts:follow_index': {'queries': 10, 'ms': 50},
+    'posts:search': {'queries': 8, 'ms': 50},
+    'posts:comments': {'queries': 6, 'ms': 50},
+    'posts:post_create': {'queries': 15, 'ms': 100},
+    'posts:post_edit': {'queries': 15, 'ms': 100},
+    'posts:add_comment': {'queries': 12, 'ms': 100},
+}
+QUERY_BUDGET_SERVER_TIMING = False
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 INTERNAL_IPS = [
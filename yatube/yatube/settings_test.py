@@ -0,0 +1,27 @@
+"""Настройки для тестов: те же бэкенды, что в проде, но файл кэша —
+во временном каталоге, чтобы тесты не чистили кэш рабочего сервера.
+
+python manage.py test --settings=yatube.settings_test
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+_cache_directory = tempfile.mkdtemp(prefix='yatube-cache-')
+atexit.register(shutil.rmtree, _cache_directory, ignore_errors=True)
+
+CACHES = {
+    'default': dict(
+        CACHES['default'],
+        LOCATION=os.path.join(_cache_directory, 'cache.sqlite3'),
+    ),
+}
+
+# Миниатюры — в том же потоке: фоновый поток пула пишет в общую базу
+# в памяти и может поймать её блокировку при очистке между тестами.
+# Сам пул проверяет ThumbnailPoolTest, включая его явно.
+THUMBNAIL_WORKERS = 0
@@ -19,6 +19,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
@@ -26,6 +28,7 @@ urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
     path('group/', include('posts.urls', namespace='group')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', metrics, name='metrics'),
 ]
 
 if settings.DEBUG: